@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+"""
+Adaptive availability polling.
+
+Replaces fixed check times with a per-date poll interval. Dates close to
+play are polled more often than dates a week out, dates whose slots keep
+changing are polled faster, and dates that stay idle back off. The
+newly released date is polled at the minimum interval through the 22:00
+release window. Due dates are checked together in one queued job, and
+polls outside the release window stop once the process has used its
+hourly CPU or browser-seconds budget.
+
+The scheduler calls AdaptivePoller.tick every POLL_TICK_SECONDS; a tick
+never blocks on a check.
+"""
+
+import os
+import time
+import logging
+import datetime
+from collections import deque
+import pytz
+from check_jobs import check_queue
+
+logger = logging.getLogger(__name__)
+
+LONDON = pytz.timezone('Europe/London')
+
+# How often the scheduler asks the poller for due dates
+POLL_TICK_SECONDS = int(os.getenv('POLL_TICK_SECONDS', '15'))
+
+# Bounds of the per-date poll interval (seconds)
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', '30'))
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '3600'))
+
+# Starting interval (seconds) by days until the date is played: today, tomorrow, ...
+BASE_INTERVALS = [120, 300, 600, 900, 1200, 1800, 1800]
+
+# Each poll without changes stretches the interval by this factor, up to IDLE_BACKOFF_STEPS times
+IDLE_BACKOFF = 1.5
+IDLE_BACKOFF_STEPS = 6
+
+# Hourly budgets for polls outside the release window: this process's CPU seconds
+# and seconds spent in browser runs (sized for a small free-tier instance)
+POLL_CPU_BUDGET = float(os.getenv('POLL_CPU_BUDGET', '120'))
+POLL_BROWSER_BUDGET = float(os.getenv('POLL_BROWSER_BUDGET', '600'))
+BUDGET_WINDOW = 3600
+
+# Release of the date six days ahead, polled at the minimum interval from/until these UK times
+RELEASE_DAYS_AHEAD = 6
+RELEASE_WINDOW = (datetime.time(21, 55), datetime.time(22, 10))
+
+def in_release_window(now):
+    return RELEASE_WINDOW[0] <= now.time() <= RELEASE_WINDOW[1]
+
+class PollBudget:
+    """Rolling hourly CPU and browser-seconds spend of the polls."""
+
+    def __init__(self, cpu_seconds=POLL_CPU_BUDGET, browser_seconds=POLL_BROWSER_BUDGET, window=BUDGET_WINDOW):
+        self.cpu_seconds = cpu_seconds
+        self.browser_seconds = browser_seconds
+        self.window = window
+        self._spend = deque()
+
+    def record(self, cpu, browser, at=None):
+        self._spend.append((at if at is not None else time.time(), cpu, browser))
+
+    def usage(self, now=None):
+        """Return (CPU seconds, browser seconds) spent within the window."""
+        cutoff = (now if now is not None else time.time()) - self.window
+        while self._spend and self._spend[0][0] < cutoff:
+            self._spend.popleft()
+        return sum(cpu for _, cpu, _ in self._spend), sum(browser for _, _, browser in self._spend)
+
+    def exhausted(self, now=None):
+        cpu, browser = self.usage(now)
+        return cpu >= self.cpu_seconds or browser >= self.browser_seconds
+
+class DateState:
+    """Polling state of one target date."""
+
+    __slots__ = ("date", "interval", "next_due", "last_polled", "idle_polls", "churn")
+
+    def __init__(self, date):
+        self.date = date
+        self.interval = None
+        self.next_due = 0.0
+        self.last_polled = None
+        self.idle_polls = 0
+        # Slot changes per hour seen over the last poll
+        self.churn = 0.0
+
+class AdaptivePoller:
+    """Decides which dates are due and queues one check for them."""
+
+    def __init__(self, budget=None):
+        self.budget = budget or PollBudget()
+        self._dates = {}
+        self._job = None
+        self._job_dates = []
+        self._job_started = None
+        self._job_cpu = None
+        self._over_budget = False
+
+    @staticmethod
+    def is_releasing(state, now):
+        """Check whether the date is the one being released right now."""
+        return (state.date.date() - now.date()).days >= RELEASE_DAYS_AHEAD and in_release_window(now)
+
+    def poll_interval(self, state, now):
+        """Seconds until the date should be polled again."""
+        if self.is_releasing(state, now):
+            return POLL_MIN_INTERVAL
+
+        days_ahead = (state.date.date() - now.date()).days
+        base = BASE_INTERVALS[min(max(days_ahead, 0), len(BASE_INTERVALS) - 1)]
+        interval = base * IDLE_BACKOFF ** min(state.idle_polls, IDLE_BACKOFF_STEPS) / (1 + state.churn)
+        return min(max(interval, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+
+    def tick(self):
+        """Finish the bookkeeping of a completed poll and queue the dates that are due."""
+        try:
+            if self._job is not None:
+                if self._job.finished_at is None:
+                    return
+                self._finish_poll()
+
+            # Imported on the first tick so the web process starts without the checker
+            from tennis_booking import get_target_dates
+
+            now = datetime.datetime.now(LONDON)
+            timestamp = time.time()
+            targets = {date.strftime("%Y-%m-%d"): date for date in get_target_dates()}
+            self._dates = {key: self._dates.get(key) or DateState(date) for key, date in targets.items()}
+
+            due = [state for state in self._dates.values() if state.next_due <= timestamp]
+            if not due:
+                return
+
+            # Polls wait for budget to free up, except for the release itself
+            if not any(self.is_releasing(state, now) for state in due) and self.budget.exhausted(timestamp):
+                if not self._over_budget:
+                    cpu, browser = self.budget.usage(timestamp)
+                    logger.warning(f"Poll budget used up (CPU {cpu:.0f}s, browser {browser:.0f}s this hour), deferring polls")
+                self._over_budget = True
+                return
+            self._over_budget = False
+
+            self._job_dates = due
+            self._job_started = timestamp
+            self._job_cpu = time.process_time()
+            self._job = check_queue.submit([state.date for state in due])
+            logger.info(f"Polling {', '.join(state.date.strftime('%Y-%m-%d') for state in due)} (job {self._job.id})")
+        except Exception as e:
+            logger.error(f"Error in adaptive poll tick: {str(e)}")
+
+    def _finish_poll(self):
+        """Charge the poll to the budget and re-plan its dates from the changes it saw."""
+        from availability_history import history_store
+
+        job, dates, started = self._job, self._job_dates, self._job_started
+        self._job = None
+        cpu = time.process_time() - self._job_cpu
+        # Only the job's own browser runs; other runs (the sniper, watch mode) may overlap it
+        browser = job.browser_seconds
+        self.budget.record(cpu, browser)
+
+        now = datetime.datetime.now(LONDON)
+        for state in dates:
+            date_str = state.date.strftime("%Y-%m-%d")
+            # The first poll of a date has nothing to compare with
+            if state.last_polled is not None and job.status == "succeeded":
+                changes = history_store.changes_since(date_str, state.last_polled, started)
+                hours = max(started - state.last_polled, POLL_MIN_INTERVAL) / 3600
+                state.churn = changes / hours
+                state.idle_polls = 0 if changes else state.idle_polls + 1
+            else:
+                changes = 0
+            state.last_polled = started
+            state.interval = self.poll_interval(state, now)
+            state.next_due = started + state.interval
+            logger.debug(f"{date_str}: {changes} changes, next poll in {state.interval:.0f}s")
+
+        logger.info(f"Poll job {job.id} {job.status}: CPU {cpu:.1f}s, browser {browser:.1f}s")
+
+    def status(self):
+        """Current intervals and budget use, for logging and inspection."""
+        cpu, browser = self.budget.usage()
+        return {
+            "budget": {
+                "cpu_seconds": round(cpu, 1), "cpu_budget": self.budget.cpu_seconds,
+                "browser_seconds": round(browser, 1), "browser_budget": self.budget.browser_seconds
+            },
+            "dates": [
+                {
+                    "date": key,
+                    "interval_seconds": round(state.interval) if state.interval is not None else None,
+                    "next_due_in": max(0, round(state.next_due - time.time())),
+                    "idle_polls": state.idle_polls,
+                    "changes_per_hour": round(state.churn, 2)
+                }
+                for key, state in sorted(self._dates.items())
+            ]
+        }
+
+# Shared poller driven by the scheduler
+adaptive_poller = AdaptivePoller()
@@ -2,15 +2,18 @@
 
 import os
 import logging
-from flask import Flask, jsonify
+import datetime
+from flask import Flask, Response, jsonify, request
 from apscheduler.schedulers.background import BackgroundScheduler
-from tennis_booking import check_court_availability
+from check_jobs import check_queue
+from adaptive_poller import adaptive_poller, POLL_TICK_SECONDS
+from browser_manager import shared_browser
+from leader_lease import LeaderLease
+from metrics import registry, CONTENT_TYPE
+from log_config import setup_logging
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Create Flask app
@@ -19,18 +22,48 @@ app = Flask(__name__)
 # Create scheduler
 scheduler = BackgroundScheduler()
 
-# Schedule the tennis booking check to run every day between 9:55 PM and 10:05 PM UK time
-# This is approximately between 21:55 and 22:05 UTC during summer time
-scheduler.add_job(
-    check_court_availability,
-    'cron',
-    hour='21-22',
-    minute='55-5',
-    timezone='Europe/London'
+def run_release_sniper():
+    """Run sniper mode, importing it (and the browser layer) only when the job fires."""
+    from sniper import run_sniper
+    run_sniper()
+
+def refresh_auth_session():
+    """Validate (or renew) the signed-in ClubSpark session, importing it only when the job fires."""
+    from auth_session import auth_session
+    auth_session.refresh()
+
+# Check each target date at its own adaptive interval, tightest around the 10 PM release
+scheduler.add_job(adaptive_poller.tick, 'interval', seconds=POLL_TICK_SECONDS)
+
+# Make sure the saved ClubSpark session is signed in well before the window
+scheduler.add_job(refresh_auth_session, 'cron', hour=21, minute=45, timezone='Europe/London')
+
+# Keep one browser warm for the duration of the booking window
+scheduler.add_job(shared_browser.warm, 'cron', hour=21, minute=50, timezone='Europe/London')
+scheduler.add_job(shared_browser.shutdown, 'cron', hour=22, minute=10, timezone='Europe/London')
+
+# Poll the parked booking sheets tightly around the 10 PM release
+scheduler.add_job(run_release_sniper, 'cron', hour=21, minute=58, timezone='Europe/London')
+
+# Start the scheduler paused; only the worker holding the lease runs the jobs
+scheduler.start(paused=True)
+scheduler_lease = LeaderLease(
+    os.getenv('SCHEDULER_LEASE_DB', 'scheduler_lease.db'),
+    on_acquire=lambda: scheduler.resume(),
+    on_release=lambda: scheduler.pause()
 )
+scheduler_lease.start()
 
-# Start the scheduler
-scheduler.start()
+def parse_check_args(args):
+    """Read the optional date (YYYY-MM-DD) and venue query parameters, comma-separated."""
+    from tennis_booking import get_venues
+    
+    dates = [
+        datetime.datetime.strptime(value.strip(), "%Y-%m-%d")
+        for value in args.get('date', '').split(',') if value.strip()
+    ]
+    venues = get_venues([value.strip() for value in args.get('venue', '').split(',') if value.strip()])
+    return dates or None, venues
 
 @app.route('/')
 def index():
@@ -47,20 +80,82 @@ def health_check():
 
 @app.route('/run-check')
 def run_check():
-    """Manually trigger a court availability check."""
+    """Queue a court availability check and return its job id.
+
+    Optional date (YYYY-MM-DD) and venue query parameters take comma-separated
+    values; a trigger matching an in-flight check attaches to it.
+    """
+    try:
+        dates, venues = parse_check_args(request.args)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid date: {str(e)}"
+        }), 400
+    
     try:
-        check_court_availability()
+        job = check_queue.submit(dates, venues)
         return jsonify({
-            "status": "success",
-            "message": "Court availability check completed"
-        })
+            "status": "queued",
+            "job_id": job.id,
+            "job_status": job.status,
+            "status_url": f"/jobs/{job.id}"
+        }), 202
     except Exception as e:
-        logger.error(f"Error running court availability check: {str(e)}")
+        logger.error(f"Error queueing court availability check: {str(e)}")
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
 
+@app.route('/metrics')
+def metrics():
+    """Expose phase timings, slot counts and errors in Prometheus text format."""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Return the status, result and timings of a queued check."""
+    job = check_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown job {job_id}"
+        }), 404
+    return jsonify(job.to_dict())
+
+@app.route('/poller')
+def poller_status():
+    """Return the poll interval of each target date and this worker's poll budget use."""
+    return jsonify(adaptive_poller.status())
+
+@app.route('/history/<query>')
+def history(query):
+    """Aggregate the availability history: cancellations, free-rate or durations.
+
+    Optional venue (slug) and days (look-back, default 30) query parameters.
+    """
+    from availability_history import QUERIES, history_store
+    
+    if query not in QUERIES:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown query {query}, expected one of {', '.join(sorted(QUERIES))}"
+        }), 404
+    try:
+        days = int(request.args.get('days', '30'))
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "days must be a whole number"
+        }), 400
+    return jsonify({
+        "query": query,
+        "venue": request.args.get('venue'),
+        "days": days,
+        "result": QUERIES[query](history_store, request.args.get('venue'), days)
+    })
+
 if __name__ == '__main__':
     # Only for local development
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True) 
\ No newline at end of file
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Signed-in ClubSpark session.
+
+Signs in with CLUBSPARK_EMAIL and CLUBSPARK_PASSWORD and saves the browser's
+storage state (cookies and local storage) to a file, so auto-booking checks
+start their browser contexts already signed in. The scheduler validates the
+saved session before the booking window and signs in again when it is
+missing, older than AUTH_MAX_AGE_HOURS or no longer accepted.
+"""
+
+import os
+import time
+import logging
+from dotenv import load_dotenv
+from browser_manager import shared_browser
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Credentials may live in .env like the Pushover keys
+load_dotenv()
+
+CLUBSPARK_EMAIL = os.getenv('CLUBSPARK_EMAIL')
+CLUBSPARK_PASSWORD = os.getenv('CLUBSPARK_PASSWORD')
+
+# Saved storage state of the signed-in session (holds session cookies, keep it private)
+AUTH_STATE_PATH = os.getenv('AUTH_STATE_PATH', 'auth_state.json')
+
+# Sign in again once the saved session is this old, even if it still works
+AUTH_MAX_AGE_HOURS = float(os.getenv('AUTH_MAX_AGE_HOURS', '12'))
+
+SIGN_IN_URL = "https://clubspark.lta.org.uk/Account/SignIn"
+HOME_URL = "https://clubspark.lta.org.uk/"
+
+# Sign-in form fields, and the sign-out link that only signed-in pages show
+EMAIL_SELECTOR = "input[type='email'], input[name='EmailAddress'], input[name='Email']"
+PASSWORD_SELECTOR = "input[type='password']"
+SUBMIT_SELECTOR = "button[type='submit'], input[type='submit']"
+SIGNED_IN_SELECTOR = "a[href*='SignOut' i], a[href*='LogOut' i]"
+
+class AuthSession:
+    """Keeps a signed-in storage state file valid for the booking runs."""
+
+    def __init__(self, path=AUTH_STATE_PATH, email=CLUBSPARK_EMAIL, password=CLUBSPARK_PASSWORD,
+                 max_age_hours=AUTH_MAX_AGE_HOURS):
+        self.path = path
+        self.email = email
+        self.password = password
+        self.max_age_hours = max_age_hours
+
+    def is_configured(self):
+        return bool(self.email and self.password)
+
+    def storage_state(self):
+        """Path of the saved session to start browser contexts with, or None if there is none."""
+        return self.path if os.path.exists(self.path) else None
+
+    def age_hours(self):
+        return (time.time() - os.path.getmtime(self.path)) / 3600
+
+    async def validate(self, context):
+        """Check that the context is signed in by looking for the sign-out link."""
+        page = await context.new_page()
+        try:
+            with timed("auth_validate"):
+                await page.goto(HOME_URL, wait_until="domcontentloaded")
+                return await page.query_selector(SIGNED_IN_SELECTOR) is not None
+        finally:
+            await page.close()
+
+    async def sign_in(self, context):
+        """Sign in on a fresh context and save its storage state. Returns True on success."""
+        page = await context.new_page()
+        try:
+            with timed("sign_in"):
+                await page.goto(SIGN_IN_URL, wait_until="domcontentloaded")
+                await page.fill(EMAIL_SELECTOR, self.email)
+                await page.fill(PASSWORD_SELECTOR, self.password)
+                async with page.expect_navigation(wait_until="domcontentloaded", timeout=30000):
+                    await page.click(SUBMIT_SELECTOR)
+        finally:
+            await page.close()
+
+        if not await self.validate(context):
+            logger.error("Sign-in did not produce a signed-in session, check CLUBSPARK_EMAIL and CLUBSPARK_PASSWORD")
+            return False
+
+        # Write next to the old file and swap it in, so runs never read a partial session
+        temp_path = f"{self.path}.tmp"
+        await context.storage_state(path=temp_path)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.path)
+        logger.info(f"Signed in to ClubSpark and saved the session to {self.path}")
+        return True
+
+    def refresh(self, force=False):
+        """Validate the saved session, signing in again if it is missing, stale or rejected.
+
+        Returns True when a valid session is saved afterwards.
+        """
+        if not self.is_configured():
+            logger.info("CLUBSPARK_EMAIL/CLUBSPARK_PASSWORD not set, runs stay signed out")
+            return False
+
+        try:
+            state = self.storage_state()
+            if state and not force and self.age_hours() < self.max_age_hours:
+                try:
+                    valid = shared_browser.run(self.validate, storage_state=state)
+                except Exception as e:
+                    logger.warning(f"Could not validate the saved ClubSpark session: {str(e)}")
+                    valid = False
+                if valid:
+                    logger.info(f"Saved ClubSpark session is valid ({self.age_hours():.1f}h old)")
+                    return True
+                logger.info("Saved ClubSpark session was rejected, signing in again")
+            elif state and not force:
+                logger.info("Saved ClubSpark session is stale, signing in again")
+
+            return shared_browser.run(self.sign_in)
+        except Exception as e:
+            logger.error(f"Error refreshing ClubSpark session: {str(e)}")
+            return False
+
+# Shared session used by the checks and the scheduler
+auth_session = AuthSession()
+
+if __name__ == "__main__":
+    from log_config import setup_logging
+    setup_logging()
+    auth_session.refresh(force=True)
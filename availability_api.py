@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+# The booking sheet fetches its data from this ClubSpark endpoint over XHR
+AVAILABILITY_ENDPOINT_PATTERN = re.compile(r"/GetVenueSessions", re.IGNORECASE)
+
+# Path segment that carries the venue slug, e.g. /v0/VenueBooking/ClissoldParkHackney/
+VENUE_PATH_PATTERN = re.compile(r"(/VenueBooking/)[^/]+/", re.IGNORECASE)
+
+# Query parameters that carry the requested date
+DATE_PARAMS = ("startdate", "enddate", "date")
+
+# Headers worth replaying from the captured browser request
+REPLAY_HEADERS = ("user-agent", "accept", "accept-language", "x-requested-with", "referer")
+
+# Timeout (seconds) for direct availability requests
+HTTP_TIMEOUT = 5
+
+class AvailabilityShapeError(ValueError):
+    """Raised when the availability endpoint no longer returns the expected JSON."""
+
+def parse_sessions_json(data, date_str):
+    """Convert a GetVenueSessions payload into open slot records for the given date.
+
+    The records have the same keys as tennis_booking.parse_slot_record, so they
+    can be matched with is_time_in_preferences directly.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("Resources"), list):
+        raise AvailabilityShapeError("Response has no 'Resources' list")
+
+    slots = []
+    for resource in data["Resources"]:
+        if not isinstance(resource, dict) or not isinstance(resource.get("Days"), list):
+            raise AvailabilityShapeError("Resource entry has no 'Days' list")
+
+        resource_id = resource.get("ID")
+        court = resource.get("Name") or f"Court {resource_id}"
+
+        for day in resource["Days"]:
+            # Dates look like "2025-05-11T00:00:00"
+            if not str(day.get("Date", "")).startswith(date_str):
+                continue
+            sessions = day.get("Sessions")
+            if not isinstance(sessions, list):
+                raise AvailabilityShapeError("Day entry has no 'Sessions' list")
+
+            for session in sessions:
+                try:
+                    start = int(session["StartTime"])
+                    end = int(session["EndTime"])
+                    capacity = int(session.get("Capacity", 0))
+                    interval = int(session.get("Interval") or 60)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise AvailabilityShapeError(f"Unexpected session entry: {str(e)}")
+
+                # Only sessions with spare capacity are bookable
+                if capacity <= 0:
+                    continue
+
+                # Split long open sessions into the slots the sheet displays
+                for slot_start in range(start, end, interval):
+                    slots.append({
+                        "index": None,
+                        "court": court,
+                        "resource_id": resource_id,
+                        "test_id": f"booking-{resource_id}|{date_str}|{slot_start}",
+                        "title": session.get("Name"),
+                        "time_text": None,
+                        "start_minutes": slot_start,
+                        "end_minutes": min(slot_start + interval, end)
+                    })
+
+    return slots
+
+def with_venue(url, venue_slug):
+    """Return url with the venue path segment (/VenueBooking/<slug>/) replaced."""
+    if not venue_slug:
+        return url
+    return VENUE_PATH_PATTERN.sub(lambda match: f"{match.group(1)}{venue_slug}/", url, count=1)
+
+def with_date(url, date_str):
+    """Return url with its date query parameters set to date_str."""
+    parts = urlsplit(url)
+    query = [
+        (key, date_str if key.lower() in DATE_PARAMS else value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+class AvailabilityClient:
+    """Polls the booking sheet's data endpoint directly once it has been discovered.
+
+    The endpoint is captured from a normal Playwright page load (see capture),
+    or set explicitly through AVAILABILITY_API_URL, e.g. to point at a local
+    stub server.
+    """
+
+    def __init__(self, endpoint_url=None):
+        self.endpoint_url = endpoint_url
+        self.headers = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def is_ready(self):
+        """Return True if an endpoint is known."""
+        return bool(self.endpoint_url)
+
+    def capture(self, response):
+        """Playwright response listener that records the availability XHR."""
+        if self.endpoint_url or not AVAILABILITY_ENDPOINT_PATTERN.search(response.url):
+            return
+        if response.status != 200:
+            return
+
+        self.endpoint_url = response.url
+        request_headers = response.request.headers
+        self.headers = {k: v for k, v in request_headers.items() if k.lower() in REPLAY_HEADERS}
+        logger.info(f"Discovered availability endpoint: {self.endpoint_url}")
+
+    def reset(self):
+        """Forget the discovered endpoint so the next browser run captures it again."""
+        if self.endpoint_url:
+            logger.info("Resetting discovered availability endpoint")
+        self.endpoint_url = None
+        self.headers = {}
+
+    def fetch_slots(self, date_str, venue_slug=None):
+        """Fetch and parse the open slots for date_str (at venue_slug, if given) over plain HTTP."""
+        url = with_date(with_venue(self.endpoint_url, venue_slug), date_str)
+        start = time.perf_counter()
+        response = self.session.get(url, headers=self.headers, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+
+        try:
+            data = response.json()
+        except ValueError:
+            raise AvailabilityShapeError("Availability endpoint did not return JSON")
+
+        slots = parse_sessions_json(data, date_str)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Fetched {len(slots)} open slots over HTTP in {elapsed_ms:.0f}ms")
+        return slots
+
+# Shared client; AVAILABILITY_API_URL skips discovery (useful with a stub server)
+availability_client = AvailabilityClient(os.getenv('AVAILABILITY_API_URL'))
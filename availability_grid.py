@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Width of one grid cell in minutes; a slot occupies the cell of its start time
+CELL_MINUTES = 15
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+
+def court_key(slot):
+    """Identify a court by its resource ID, falling back to its name."""
+    return slot["resource_id"] or slot["court"]
+
+def cell_for(start_minutes):
+    return min(max(start_minutes // CELL_MINUTES, 0), CELLS_PER_DAY - 1)
+
+def touches(slot, cells):
+    """Check whether a slot (or coalesced run) covers any of the given (court key, start minute) cells."""
+    key = court_key(slot)
+    first = cell_for(slot["start_minutes"]) * CELL_MINUTES
+    return any((key, start) in cells for start in range(first, slot["end_minutes"], CELL_MINUTES))
+
+class CourtRow:
+    """Open slot starts of one court as a bitset (bit n = cell n is free)."""
+
+    __slots__ = ("key", "court", "bits")
+
+    def __init__(self, key, court, bits=0):
+        self.key = key
+        self.court = court
+        self.bits = bits
+
+    def starts(self, bits=None):
+        """Yield the start minute of every set bit in bits (default: this row)."""
+        bits = self.bits if bits is None else bits
+        while bits:
+            low = bits & -bits
+            yield (low.bit_length() - 1) * CELL_MINUTES
+            bits ^= low
+
+class AvailabilityGrid:
+    """Court x time-slot availability of one venue on one date."""
+
+    __slots__ = ("venue", "date", "rows")
+
+    def __init__(self, venue, date, rows=None):
+        self.venue = venue
+        self.date = date
+        self.rows = rows or {}
+
+    @classmethod
+    def from_slots(cls, venue, date, slots):
+        """Build a grid from extracted slot records."""
+        grid = cls(venue, date)
+        for slot in slots:
+            if slot["start_minutes"] is None:
+                continue
+            key = court_key(slot)
+            row = grid.rows.get(key)
+            if row is None:
+                row = grid.rows[key] = CourtRow(key, slot["court"])
+            row.bits |= 1 << cell_for(slot["start_minutes"])
+        return grid
+
+    def diff(self, previous):
+        """Compare with an earlier grid of the same sheet.
+
+        Returns (opened, taken) as sets of (court key, start minute); with no
+        previous grid every open slot counts as newly opened.
+        """
+        previous_rows = previous.rows if previous else {}
+        opened = set()
+        taken = set()
+
+        for key, row in self.rows.items():
+            before = previous_rows[key].bits if key in previous_rows else 0
+            opened.update((key, start) for start in row.starts(row.bits & ~before))
+            taken.update((key, start) for start in row.starts(before & ~row.bits))
+
+        for key, row in previous_rows.items():
+            if key not in self.rows:
+                taken.update((key, start) for start in row.starts())
+
+        return opened, taken
+
+    def dumps(self):
+        """Serialise the rows compactly: {court key: [court name, bits as hex]}."""
+        return json.dumps({key: [row.court, format(row.bits, "x")] for key, row in self.rows.items()})
+
+    @classmethod
+    def loads(cls, venue, date, payload):
+        rows = {key: CourtRow(key, court, int(bits, 16)) for key, (court, bits) in json.loads(payload).items()}
+        return cls(venue, date, rows)
+
+class GridSnapshotStore:
+    """Persists the latest AvailabilityGrid per venue and date between runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS availability_grids (
+                    venue TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (venue, date)
+                )"""
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """Yield a short-lived connection, committing on success."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, venue, date):
+        """Return the stored grid for a venue and date, or None."""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT payload FROM availability_grids WHERE venue = ? AND date = ?", (venue, date)
+            ).fetchone()
+        return AvailabilityGrid.loads(venue, date, row[0]) if row else None
+
+    def save(self, grid):
+        now = datetime.datetime.utcnow().isoformat(timespec="seconds")
+        with self._lock, self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO availability_grids VALUES (?, ?, ?, ?)",
+                (grid.venue, grid.date, grid.dumps(), now)
+            )
+
+    def evict_expired(self, today):
+        """Delete grids dated before today (a YYYY-MM-DD string)."""
+        with self._lock, self._transaction() as conn:
+            return conn.execute("DELETE FROM availability_grids WHERE date < ?", (today,)).rowcount
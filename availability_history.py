@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+"""
+Availability history.
+
+Every scanned sheet is folded into open intervals per slot (venue, court,
+date, start) with the time it was first and last seen open, plus per-day
+scan counts per court. The aggregate queries answer when cancellations
+appear, how often each court has a free slot and how long slots stay open:
+
+    python availability_history.py cancellations --venue ClissoldParkHackney --days 30
+    python availability_history.py free-rate
+    python availability_history.py durations
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+from contextlib import contextmanager
+import pytz
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'availability_history.db')
+
+# Intervals and scan counts older than this many days are deleted
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '180'))
+
+# Slots of the day this far ahead open at the nightly release, which is not a cancellation
+RELEASE_DAYS_AHEAD = 6
+
+LONDON = pytz.timezone('Europe/London')
+
+# Lead time buckets (hours before the slot starts) for cancellation openings
+LEAD_BUCKETS = ((2, "<2h"), (6, "2-6h"), (24, "6-24h"), (72, "1-3d"), (None, "3d+"))
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS slot_intervals (
+        id INTEGER PRIMARY KEY,
+        venue TEXT NOT NULL,
+        court TEXT NOT NULL,
+        date TEXT NOT NULL,
+        start_minutes INTEGER NOT NULL,
+        starts_at REAL NOT NULL,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        first_seen_hour INTEGER NOT NULL,
+        at_release INTEGER NOT NULL,
+        is_open INTEGER NOT NULL
+    )""",
+    # Open intervals of one sheet, read on every scan
+    "CREATE INDEX IF NOT EXISTS slot_intervals_sheet ON slot_intervals (venue, date, is_open)",
+    # Time-range aggregates over one or all venues
+    "CREATE INDEX IF NOT EXISTS slot_intervals_seen ON slot_intervals (venue, first_seen)",
+    "CREATE INDEX IF NOT EXISTS slot_intervals_first_seen ON slot_intervals (first_seen)",
+    # Recent changes of one date across venues, read by the adaptive poller
+    "CREATE INDEX IF NOT EXISTS slot_intervals_date ON slot_intervals (date, last_seen)",
+    """CREATE TABLE IF NOT EXISTS history_sheets (
+        venue TEXT NOT NULL,
+        date TEXT NOT NULL,
+        first_scan REAL NOT NULL,
+        last_scan REAL NOT NULL,
+        scans INTEGER NOT NULL,
+        PRIMARY KEY (venue, date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS venue_scan_counts (
+        venue TEXT NOT NULL,
+        scan_day TEXT NOT NULL,
+        scans INTEGER NOT NULL,
+        PRIMARY KEY (venue, scan_day)
+    )""",
+    """CREATE TABLE IF NOT EXISTS court_scan_counts (
+        venue TEXT NOT NULL,
+        scan_day TEXT NOT NULL,
+        court TEXT NOT NULL,
+        open_scans INTEGER NOT NULL,
+        open_slots INTEGER NOT NULL,
+        PRIMARY KEY (venue, scan_day, court)
+    )""",
+    "CREATE INDEX IF NOT EXISTS court_scan_counts_day ON court_scan_counts (scan_day)"
+)
+
+def slot_start_timestamp(date_str, start_minutes):
+    """Unix timestamp of a slot's start (UK time)."""
+    day = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    return LONDON.localize(day + datetime.timedelta(minutes=start_minutes)).timestamp()
+
+def lead_bucket(lead_hours):
+    for limit, label in LEAD_BUCKETS:
+        if limit is None or lead_hours < limit:
+            return label
+
+class AvailabilityHistory:
+    """Append-only history of open slots across scans, with aggregate queries.
+
+    A slot's open interval starts on the first scan that shows it open and
+    ends on the first scan that no longer does; each scan only touches the
+    open intervals of its own sheet.
+    """
+
+    def __init__(self, path):
+        # Resolved once, since every call reconnects and callers may change directory
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            # WAL keeps the per-scan commits cheap and lets queries read alongside them
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        """Yield a short-lived connection, committing on success."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_scan(self, venue, date_str, slots, scanned_at=None):
+        """Fold one scan of a sheet (its open slot records) into the history."""
+        now = scanned_at if scanned_at is not None else time.time()
+        local_now = datetime.datetime.fromtimestamp(now, LONDON)
+        scan_day = local_now.strftime("%Y-%m-%d")
+        at_release = int((datetime.datetime.strptime(date_str, "%Y-%m-%d").date() - local_now.date()).days >= RELEASE_DAYS_AHEAD)
+
+        open_slots = {(slot["court"], slot["start_minutes"]) for slot in slots if slot["start_minutes"] is not None}
+        per_court = {}
+        for court, _ in open_slots:
+            per_court[court] = per_court.get(court, 0) + 1
+
+        with self._lock, self._transaction() as conn:
+            known = {
+                (court, start): interval_id for interval_id, court, start in conn.execute(
+                    "SELECT id, court, start_minutes FROM slot_intervals WHERE venue = ? AND date = ? AND is_open = 1",
+                    (venue, date_str)
+                )
+            }
+            conn.executemany(
+                "UPDATE slot_intervals SET is_open = 0 WHERE id = ?",
+                [(interval_id,) for key, interval_id in known.items() if key not in open_slots]
+            )
+            conn.executemany(
+                "UPDATE slot_intervals SET last_seen = ? WHERE id = ?",
+                [(now, interval_id) for key, interval_id in known.items() if key in open_slots]
+            )
+            conn.executemany(
+                "INSERT INTO slot_intervals (venue, court, date, start_minutes, starts_at, first_seen, last_seen, "
+                "first_seen_hour, at_release, is_open) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                [
+                    (venue, court, date_str, start, slot_start_timestamp(date_str, start), now, now, local_now.hour, at_release)
+                    for court, start in open_slots if (court, start) not in known
+                ]
+            )
+            conn.execute(
+                "INSERT INTO history_sheets VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (venue, date) DO UPDATE SET last_scan = excluded.last_scan, scans = scans + 1",
+                (venue, date_str, now, now)
+            )
+            conn.execute(
+                "INSERT INTO venue_scan_counts VALUES (?, ?, 1) "
+                "ON CONFLICT (venue, scan_day) DO UPDATE SET scans = scans + 1",
+                (venue, scan_day)
+            )
+            conn.executemany(
+                "INSERT INTO court_scan_counts VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT (venue, scan_day, court) DO UPDATE SET "
+                "open_scans = open_scans + 1, open_slots = open_slots + excluded.open_slots",
+                [(venue, scan_day, court, count) for court, count in per_court.items()]
+            )
+
+    def changes_since(self, date_str, previous, since):
+        """Count slots of a date that changed between two polls (Unix timestamps of their start).
+
+        Counts slots first seen open since the latest poll started, and slots
+        now taken whose last open sighting was in the poll before it.
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM slot_intervals WHERE date = ? AND last_seen >= ? "
+                "AND (first_seen >= ? OR (is_open = 0 AND last_seen < ?))",
+                (date_str, previous, since, since)
+            ).fetchone()[0]
+
+    def evict_expired(self, retention_days=HISTORY_RETENTION_DAYS):
+        """Delete intervals and scan counts older than the retention period."""
+        cutoff = time.time() - retention_days * 86400
+        cutoff_day = datetime.datetime.fromtimestamp(cutoff, LONDON).strftime("%Y-%m-%d")
+        with self._lock, self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM slot_intervals WHERE first_seen < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM history_sheets WHERE last_scan < ?", (cutoff,))
+            conn.execute("DELETE FROM venue_scan_counts WHERE scan_day < ?", (cutoff_day,))
+            conn.execute("DELETE FROM court_scan_counts WHERE scan_day < ?", (cutoff_day,))
+        if deleted:
+            logger.info(f"Evicted {deleted} availability history intervals older than {retention_days} days")
+        return deleted
+
+    @staticmethod
+    def _filters(venue, since, column, table=""):
+        """WHERE clause and parameters for an optional venue and a lower bound on column."""
+        prefix = f"{table}." if table else ""
+        if venue:
+            return f"{prefix}venue = ? AND {prefix}{column} >= ?", [venue, since]
+        return f"{prefix}{column} >= ?", [since]
+
+    def cancellations(self, venue=None, days=30):
+        """When cancelled slots reappear: openings by hour of day (UK) and by lead time before play.
+
+        Openings seen on a sheet's first scan, or on the newly released day,
+        are not cancellations and are left out.
+        """
+        where, params = self._filters(venue, time.time() - days * 86400, "first_seen", "i")
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT i.first_seen_hour, i.starts_at - i.first_seen FROM slot_intervals i "
+                "JOIN history_sheets s ON s.venue = i.venue AND s.date = i.date "
+                f"WHERE {where} AND i.at_release = 0 AND i.first_seen > s.first_scan",
+                params
+            ).fetchall()
+
+        by_hour = [0] * 24
+        by_lead = {label: 0 for _, label in LEAD_BUCKETS}
+        for hour, lead_seconds in rows:
+            by_hour[hour] += 1
+            by_lead[lead_bucket(lead_seconds / 3600)] += 1
+        return {
+            "openings": len(rows),
+            "by_hour": [{"hour": hour, "openings": count} for hour, count in enumerate(by_hour)],
+            "by_lead_time": [{"lead_time": label, "openings": count} for label, count in by_lead.items()]
+        }
+
+    def free_rates(self, venue=None, days=30):
+        """Per court, the share of sheet scans that showed at least one open slot on it."""
+        since_day = datetime.datetime.fromtimestamp(time.time() - days * 86400, LONDON).strftime("%Y-%m-%d")
+        where, params = self._filters(venue, since_day, "scan_day")
+        with self._transaction() as conn:
+            scans = dict(conn.execute(
+                f"SELECT venue, SUM(scans) FROM venue_scan_counts WHERE {where} GROUP BY venue", params
+            ).fetchall())
+            rows = conn.execute(
+                f"SELECT venue, court, SUM(open_scans), SUM(open_slots) FROM court_scan_counts WHERE {where} "
+                "GROUP BY venue, court ORDER BY venue, court",
+                params
+            ).fetchall()
+        return [
+            {
+                "venue": row_venue,
+                "court": court,
+                "scans": scans.get(row_venue, 0),
+                "open_scans": open_scans,
+                "free_rate": round(open_scans / scans[row_venue], 4) if scans.get(row_venue) else None,
+                "avg_open_slots": round(open_slots / open_scans, 2) if open_scans else 0
+            }
+            for row_venue, court, open_scans, open_slots in rows
+        ]
+
+    def open_durations(self, venue=None, days=30):
+        """Per court, how long slots stayed open (minutes) before they were taken or the scans ended."""
+        where, params = self._filters(venue, time.time() - days * 86400, "first_seen", "i")
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT i.venue, i.court, COUNT(*), SUM(i.is_open), AVG(i.last_seen - i.first_seen), "
+                f"MAX(i.last_seen - i.first_seen) FROM slot_intervals i WHERE {where} "
+                "GROUP BY i.venue, i.court ORDER BY i.venue, i.court",
+                params
+            ).fetchall()
+        return [
+            {
+                "venue": row_venue,
+                "court": court,
+                "intervals": count,
+                "still_open": still_open,
+                "avg_open_minutes": round(avg_seconds / 60, 1),
+                "max_open_minutes": round(max_seconds / 60, 1)
+            }
+            for row_venue, court, count, still_open, avg_seconds, max_seconds in rows
+        ]
+
+# Query names used by the CLI and the /history endpoint
+QUERIES = {
+    "cancellations": AvailabilityHistory.cancellations,
+    "free-rate": AvailabilityHistory.free_rates,
+    "durations": AvailabilityHistory.open_durations
+}
+
+# Shared history written by the checks
+history_store = AvailabilityHistory(HISTORY_DB_PATH)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the availability history")
+    parser.add_argument("query", choices=sorted(QUERIES))
+    parser.add_argument("--venue", help="only this venue slug")
+    parser.add_argument("--days", type=int, default=30, help="look back this many days (default: 30)")
+    args = parser.parse_args()
+
+    print(json.dumps(QUERIES[args.query](history_store, args.venue, args.days), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
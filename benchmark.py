@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+"""
+Offline benchmark of the availability check against recorded booking sheets.
+
+The sheets in benchmark_fixtures/ are served from a local HTTP server that
+tennis_booking is pointed at, with notifications going to a stub channel.
+The end-to-end check and its load, extraction, matching and notification
+stages are timed per fixture and compared with benchmark_baseline.json; a
+stage whose median is slower than its baseline by more than the tolerance
+fails the run. Timings only compare on the same machine, so the first run
+on a machine (and any new fixture or stage) is stored as the baseline,
+together with the machine and block profile it was measured on.
+
+    python benchmark.py                        # run and compare with the baseline
+    python benchmark.py --update-baseline      # store the results as the new baseline
+    python benchmark.py --record NAME VENUE DATE   # capture a live sheet as a fixture
+"""
+
+import os
+import sys
+import html
+import platform
+import json
+import math
+import time
+import argparse
+import datetime
+import logging
+import tempfile
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, quote
+import tennis_booking
+from tennis_booking import (
+    BLOCK_PROFILE, get_venues, get_venue_settings, get_booking_url, get_day_type,
+    load_booking_sheet, extract_slots, rank_slots, slot_notification_info, check_court_availability
+)
+from browser_manager import shared_browser
+from availability_api import availability_client, AVAILABILITY_ENDPOINT_PATTERN
+from notifications import NotificationDispatcher
+from notified_store import NotifiedSlotStore
+from availability_grid import GridSnapshotStore
+from availability_history import AvailabilityHistory
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BASE_DIR, "benchmark_fixtures")
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, "fixtures.json")
+BASELINE_PATH = os.path.join(BASE_DIR, "benchmark_baseline.json")
+
+# Baseline key describing where its timings were measured
+MEASURED_ON_KEY = "_measured_on"
+
+# A stage regresses when its median exceeds baseline * (1 + tolerance) + slack
+DEFAULT_TOLERANCE = 0.25
+SLACK_MS = 2.0
+
+# Wraps a captured .booking-sheet element into a standalone page
+FIXTURE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Book by date - {name}</title>
+</head>
+<body>
+  {sheet}
+</body>
+</html>
+"""
+
+# Injected into served sheets: clicking an open slot opens its booking form like the
+# live site, with the court, date and start time (from data-test-id) in the form URL
+BOOKING_FLOW_JS = b"""<script>
+document.addEventListener('click', event => {
+    const slot = event.target.closest('.not-booked');
+    if (slot) {
+        const [guid, date, start] = (slot.getAttribute('data-test-id') || '').split('|');
+        const query = new URLSearchParams({
+            ResourceID: slot.getAttribute('data-resourceid') || (guid || '').replace(/^booking-/, ''),
+            Date: date || '',
+            StartTime: start || ''
+        });
+        location.href = location.pathname.replace(/BookByDate$/, 'Form') + '?' + query;
+    }
+});
+</script>
+"""
+
+# The form carries the slot's parameters on to "Continue booking", and so into the returnUrl
+FORM_HTML = """<!DOCTYPE html>
+<html><body>
+<form action="Continue" method="get">
+  {fields}
+  <button id="submit-booking" class="primary" type="submit">Continue booking</button>
+</form>
+</body></html>
+"""
+
+SIGNIN_HTML = "<!DOCTYPE html>\n<html><body><h1>Sign in</h1></body></html>\n"
+
+def load_manifest():
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves fixture sheets at ClubSpark's paths, using the fixture name as the venue slug."""
+
+    fixtures = {}
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        segments = [segment for segment in parts.path.split("/") if segment]
+
+        if len(segments) == 3 and segments[1:] == ["Booking", "BookByDate"]:
+            return self.send_fixture(segments[0], ".html")
+        if len(segments) == 4 and segments[:2] == ["v0", "VenueBooking"] and AVAILABILITY_ENDPOINT_PATTERN.search(parts.path):
+            return self.send_fixture(segments[2], ".json")
+        if len(segments) == 3 and segments[1:] == ["Booking", "Form"]:
+            fields = "".join(
+                f'<input type="hidden" name="{html.escape(key)}" value="{html.escape(value)}">'
+                for key, value in parse_qsl(parts.query)
+            )
+            return self.send_body(200, FORM_HTML.format(fields=fields).encode(), "text/html")
+        if len(segments) == 3 and segments[1:] == ["Booking", "Continue"]:
+            return_url = quote(f"/{segments[0]}/Booking/Form?{parts.query}", safe="")
+            return self.send_body(302, b"", "text/html", {"Location": f"/Account/SignIn?returnUrl={return_url}"})
+        if segments == ["Account", "SignIn"]:
+            return self.send_body(200, SIGNIN_HTML.encode(), "text/html")
+        return self.send_body(404, b"Not found", "text/plain")
+
+    def send_fixture(self, name, suffix):
+        if name not in self.fixtures:
+            return self.send_body(404, b"Unknown fixture", "text/plain")
+        with open(os.path.join(FIXTURES_DIR, name + suffix), "rb") as f:
+            body = f.read()
+        if suffix == ".html":
+            body = body.replace(b"</body>", BOOKING_FLOW_JS + b"</body>", 1)
+            return self.send_body(200, body, "text/html; charset=utf-8")
+        return self.send_body(200, body, "application/json")
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep request logs out of the benchmark output
+        pass
+
+def start_fixture_server(fixtures):
+    """Serve the fixtures on an ephemeral local port; returns (server, base URL)."""
+    FixtureHandler.fixtures = fixtures
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+class StubChannel:
+    """Notification channel that records digests instead of sending them."""
+
+    name = "stub"
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.sent = []
+
+    def send(self, notification):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        self.sent.append(notification)
+
+def percentile(samples, q):
+    """Nearest-rank percentile of samples."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples_ms):
+    return {
+        "runs": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p90_ms": round(percentile(samples_ms, 90), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "mean_ms": round(statistics.mean(samples_ms), 3)
+    }
+
+async def time_page_stages(context, name, date_str, runs):
+    """Time loading and extracting a fixture sheet; returns (timings, last extracted slots)."""
+    url = get_booking_url(name, date_str)
+    page = await context.new_page()
+    timings = {"load": [], "extract": []}
+    slots = []
+    try:
+        for _ in range(runs):
+            # Leave the sheet first so every load is a full navigation
+            await page.goto("about:blank")
+            start = time.perf_counter()
+            await load_booking_sheet(page, url)
+            timings["load"].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            slots = await extract_slots(page)
+            timings["extract"].append((time.perf_counter() - start) * 1000)
+    finally:
+        await page.close()
+    return timings, slots
+
+def time_matching(slots, date, settings, runs):
+    day_type = get_day_type(date)
+    timings = []
+    matches = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        matches = rank_slots(slots, day_type, settings)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, matches
+
+def time_notification(matches, name, date_str, latency_ms, runs):
+    if not matches:
+        return []
+    dispatcher = NotificationDispatcher([StubChannel(latency_ms)])
+    slot_infos = [
+        slot_notification_info({**slot, "date": date_str, "venue_name": name, "url": get_booking_url(name, date_str)})
+        for slot in matches
+    ]
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        dispatcher.notify(slot_infos).result(30)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def time_check(name, date, runs, workdir):
+    """Time the end-to-end check on one fixture, with fresh stores for every run."""
+    venues = get_venues([name])
+    timings = []
+    notified_runs = 0
+    for run in range(runs):
+        # Fresh stores, so every run sees the sheet as newly opened
+        tennis_booking.notified_store = NotifiedSlotStore(os.path.join(workdir, f"notified_{name}_{run}.db"))
+        tennis_booking.grid_store = GridSnapshotStore(os.path.join(workdir, f"grids_{name}_{run}.db"))
+        tennis_booking.history_store = AvailabilityHistory(os.path.join(workdir, f"history_{name}_{run}.db"))
+        start = time.perf_counter()
+        notified = check_court_availability([date], venues)
+        tennis_booking.notifier.flush(30)
+        timings.append((time.perf_counter() - start) * 1000)
+        notified_runs += bool(notified)
+    return timings, notified_runs
+
+def run_benchmarks(fixtures, runs, check_runs, latency_ms, workdir):
+    """Benchmark every fixture; returns {fixture: {stage: summary}}."""
+    results = {}
+    for name, fixture in fixtures.items():
+        date_str = fixture["date"]
+        date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        settings = get_venue_settings(get_venues([name])[0])
+
+        timings, slots = shared_browser.run(
+            lambda context: time_page_stages(context, name, date_str, runs),
+            block_profile=BLOCK_PROFILE
+        )
+        timings["match"], matches = time_matching(slots, date, settings, runs)
+        notify_timings = time_notification(matches, name, date_str, latency_ms, runs)
+        if notify_timings:
+            timings["notify"] = notify_timings
+        timings["check"], notified_runs = time_check(name, date, check_runs, workdir)
+
+        results[name] = {stage: summarize(samples) for stage, samples in timings.items()}
+        print(
+            f"{name}: {len(slots)} open slots, {len(matches)} matches, "
+            f"notified in {notified_runs}/{check_runs} checks"
+        )
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a (fixture, stage, p50, baseline p50) tuple per regressed stage."""
+    regressions = []
+    for name, stages in results.items():
+        for stage, summary in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if base and summary["p50_ms"] > base["p50_ms"] * (1 + tolerance) + SLACK_MS:
+                regressions.append((name, stage, summary["p50_ms"], base["p50_ms"]))
+    return regressions
+
+def print_report(results, baseline):
+    print(f"\n{'fixture':<14} {'stage':<8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'base p50':>9} {'change':>8}")
+    for name, stages in results.items():
+        for stage, summary in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            base_text = f"{base['p50_ms']:9.1f}" if base else f"{'-':>9}"
+            change = f"{(summary['p50_ms'] / base['p50_ms'] - 1) * 100:+7.0f}%" if base and base["p50_ms"] else f"{'-':>8}"
+            print(
+                f"{name:<14} {stage:<8} {summary['p50_ms']:9.1f} {summary['p90_ms']:9.1f} "
+                f"{summary['p99_ms']:9.1f} {summary['mean_ms']:9.1f} {base_text} {change}"
+            )
+
+async def capture_sheet(context, venue_slug, date_str):
+    """Load a live booking sheet and return its .booking-sheet HTML and availability JSON."""
+    page = await context.new_page()
+    captured = {}
+
+    async def on_response(response):
+        if "data" not in captured and response.status == 200 and AVAILABILITY_ENDPOINT_PATTERN.search(response.url):
+            try:
+                captured["data"] = await response.json()
+            except Exception as e:
+                logger.warning(f"Could not read availability response: {str(e)}")
+
+    page.on("response", on_response)
+    await load_booking_sheet(page, get_booking_url(venue_slug, date_str))
+    sheet = await page.eval_on_selector(".booking-sheet", "el => el.outerHTML")
+    return sheet, captured.get("data")
+
+def record(name, venue_slug, date_str):
+    """Capture a live booking sheet as fixture name."""
+    sheet, data = shared_browser.run(
+        lambda context: capture_sheet(context, venue_slug, date_str),
+        block_profile=BLOCK_PROFILE
+    )
+    with open(os.path.join(FIXTURES_DIR, f"{name}.html"), "w") as f:
+        f.write(FIXTURE_TEMPLATE.format(name=name, sheet=sheet))
+    if data is None:
+        logger.warning("No availability response captured; HTTP mode will fall back to the browser")
+    else:
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json"), "w") as f:
+            json.dump(data, f, indent=1)
+
+    manifest = load_manifest()
+    manifest[name] = {
+        "date": date_str,
+        "description": f"Recorded from {venue_slug} on {datetime.date.today().isoformat()}"
+    }
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=4)
+        f.write("\n")
+    print(f"Recorded {venue_slug} {date_str} as fixture '{name}'")
+
+def write_baseline(path, baseline):
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=4)
+        f.write("\n")
+    print(f"\nBaseline written to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the availability check against recorded booking sheets")
+    parser.add_argument("--fixtures", nargs="+", help="fixture names to run (default: all)")
+    parser.add_argument("--runs", type=int, default=10, help="runs per stage (default: 10)")
+    parser.add_argument("--check-runs", type=int, default=5, help="end-to-end checks per fixture (default: 5)")
+    parser.add_argument("--notify-latency", type=float, default=0, help="simulated notification latency in ms")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed median slowdown (default: 0.25)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--record", nargs=3, metavar=("NAME", "VENUE", "DATE"), help="capture a live sheet as a fixture")
+    parser.add_argument("--verbose", action="store_true", help="keep the checker's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.record:
+        record(*args.record)
+        shared_browser.shutdown()
+        return 0
+
+    manifest = load_manifest()
+    fixtures = {name: manifest[name] for name in (args.fixtures or manifest)}
+
+    server, base_url = start_fixture_server(fixtures)
+    tennis_booking.CLUBSPARK_URL = base_url
+    tennis_booking.notifier = NotificationDispatcher([StubChannel(args.notify_latency)])
+    if tennis_booking.AVAILABILITY_MODE == "http":
+        # The HTTP check's date and venue are substituted per request
+        availability_client.endpoint_url = f"{base_url}/v0/VenueBooking/fixture/GetVenueSessions?startDate=&endDate="
+        availability_client.headers = {}
+
+    # Screenshots taken during click-through land in the scratch directory
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="tennis-benchmark-")
+    os.chdir(workdir)
+    try:
+        shared_browser.warm()
+        results = run_benchmarks(fixtures, args.runs, args.check_runs, args.notify_latency, workdir)
+    finally:
+        os.chdir(cwd)
+        shared_browser.shutdown()
+        server.shutdown()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    measured_on = {
+        "machine": platform.node(), "platform": platform.platform(),
+        "python": platform.python_version(), "block_profile": BLOCK_PROFILE
+    }
+    if args.update_baseline:
+        write_baseline(args.baseline, {**baseline, **results, MEASURED_ON_KEY: measured_on})
+        return 0
+
+    if baseline.get(MEASURED_ON_KEY) and baseline[MEASURED_ON_KEY] != measured_on:
+        print(f"\nWARNING: baseline was measured on {baseline[MEASURED_ON_KEY]}, this run on {measured_on}")
+
+    # Stages measured for the first time become their own baseline; later runs compare against it
+    unchecked = {
+        name: {stage: summary for stage, summary in stages.items() if not baseline.get(name, {}).get(stage)}
+        for name, stages in results.items()
+    }
+    unchecked = {name: stages for name, stages in unchecked.items() if stages}
+    if unchecked:
+        print(f"\nNo baseline yet for {', '.join(f'{name}/{stage}' for name, stages in unchecked.items() for stage in stages)}")
+        merged = {name: {**baseline.get(name, {}), **stages} for name, stages in unchecked.items()}
+        write_baseline(args.baseline, {MEASURED_ON_KEY: measured_on, **baseline, **merged})
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, stage, p50, base in regressions:
+        print(f"REGRESSION {name}/{stage}: p50 {p50:.1f}ms vs baseline {base:.1f}ms")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import re
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
+
+logger = logging.getLogger(__name__)
+
+# Ways a booking form URL may spell each of a slot's link fields
+FIELD_FORMATS = {
+    "venue": lambda fields: fields["venue"],
+    "resource_id": lambda fields: fields["resource_id"],
+    "date": lambda fields: fields["date"],
+    "start_minutes": lambda fields: str(fields["start"]),
+    "start_time": lambda fields: f"{fields['start'] // 60:02d}:{fields['start'] % 60:02d}",
+    "end_minutes": lambda fields: str(fields["end"]),
+    "end_time": lambda fields: f"{fields['end'] // 60:02d}:{fields['end'] % 60:02d}"
+}
+
+# A template must place at least these fields to tell one slot's form from another's
+REQUIRED_FIELDS = ("resource_id", "date", "start")
+
+# Values that look like an identifier (a GUID, or a long token containing digits). Left
+# in the template, such a value would send every other slot to the learned slot's form
+ID_LIKE_PATTERN = re.compile(r"^(?=.*\d)[0-9a-z_-]{6,}$", re.IGNORECASE)
+
+def return_url_of(redirect_url):
+    """Return the absolute returnUrl carried by a sign-in redirect, or None."""
+    for key, value in parse_qsl(urlsplit(redirect_url).query):
+        if key.lower() == "returnurl" and value:
+            return urljoin(redirect_url, value)
+    return None
+
+class BookingLinkTemplate:
+    """Booking form URL pattern learned from a real "Continue booking" redirect.
+
+    ClubSpark sends signed-out users to sign in with the booking form URL as
+    the returnUrl. The parts of that URL holding the clicked slot's venue,
+    resource ID, date and times are replaced by placeholders, and the rest is
+    kept as it was. A URL whose remaining parts include an ID-like value is
+    not learned, since that value may belong to the clicked slot alone. No
+    links are built until a redirect has been learned.
+    """
+
+    def __init__(self):
+        self.base = None
+        self.path = None
+        self.query = None
+
+    def is_ready(self):
+        """Return True if a template is known."""
+        return self.path is not None
+
+    @staticmethod
+    def placeholder(value, fields):
+        """Return the field format a URL part spells for these fields, or None."""
+        for name, format_field in FIELD_FORMATS.items():
+            if value.lower() == format_field(fields).lower():
+                return name
+        return None
+
+    def learn(self, redirect_url, fields):
+        """Learn the template from a sign-in redirect captured for the slot with these link fields.
+
+        Returns True if a template was learned.
+        """
+        booking_url = return_url_of(redirect_url)
+        if not booking_url or not fields:
+            return False
+
+        parts = urlsplit(booking_url)
+        path = [(self.placeholder(segment, fields), segment) for segment in parts.path.split("/")]
+        query = [(key, self.placeholder(value, fields), value) for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+
+        placed = {name for name, _ in path if name} | {name for _, name, _ in query if name}
+        missing = [field for field in REQUIRED_FIELDS if not any(name.startswith(field) for name in placed)]
+        if missing:
+            logger.warning(f"Booking form URL {booking_url} does not show the slot's {', '.join(missing)}, not using it for links")
+            return False
+
+        unknown = [value for name, value in path if not name] + [value for _, name, value in query if not name]
+        unknown_ids = [value for value in unknown if ID_LIKE_PATTERN.match(value)]
+        if unknown_ids:
+            logger.warning(f"Booking form URL {booking_url} carries unrecognised IDs ({', '.join(unknown_ids)}), not using it for links")
+            return False
+
+        if not self.is_ready():
+            logger.info(f"Learned booking link template from {booking_url}")
+        self.base = (parts.scheme, parts.netloc)
+        self.path = path
+        self.query = query
+        return True
+
+    def build(self, fields):
+        """Return the booking form URL for a slot's link fields, or None while no template is known."""
+        if not self.is_ready():
+            return None
+
+        fill = lambda name, value: FIELD_FORMATS[name](fields) if name else value
+        path = "/".join(fill(name, segment) for name, segment in self.path)
+        query = urlencode([(key, fill(name, value)) for key, name, value in self.query])
+        return urlunsplit(self.base + (path, query, ""))
+
+# Shared template, learned by the first click-through in this process
+booking_link_template = BookingLinkTemplate()
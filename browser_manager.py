@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import re
+import time
+import asyncio
+import logging
+import threading
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Launch arguments for the cloud environment
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--single-process',
+    '--disable-gpu'
+]
+
+DEFAULT_VIEWPORT = {"width": 1920, "height": 1080}
+
+# Seconds shutdown() lets in-flight runs finish before cancelling them
+SHUTDOWN_GRACE_SECONDS = 60
+
+# Requests aborted for each page load profile. Only matching URLs are routed,
+# so everything else is fetched without a round trip through Python.
+BLOCK_PROFILES = {
+    "none": {
+        "extensions": [],
+        "hosts": []
+    },
+    "lean": {
+        # Images, media and fonts
+        "extensions": [
+            "png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp",
+            "mp4", "webm", "ogg", "mp3", "wav",
+            "woff", "woff2", "ttf", "otf", "eot"
+        ],
+        # Third-party analytics and trackers
+        "hosts": [
+            "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+            "googlesyndication.com", "facebook.net", "facebook.com", "hotjar.com",
+            "clarity.ms", "nr-data.net", "newrelic.com", "segment.io",
+            "cookielaw.org", "onetrust.com", "twitter.com", "linkedin.com"
+        ]
+    }
+}
+
+async def apply_block_profile(context, profile):
+    """Abort requests matching the named profile on every page of the context."""
+    rules = BLOCK_PROFILES.get(profile)
+    if rules is None:
+        logger.warning(f"Unknown block profile '{profile}', not blocking any requests")
+        return
+
+    async def abort(route):
+        await route.abort()
+
+    if rules["extensions"]:
+        extensions = "|".join(rules["extensions"])
+        await context.route(re.compile(rf"\.({extensions})(\?.*)?$", re.IGNORECASE), abort)
+    if rules["hosts"]:
+        hosts = "|".join(re.escape(host) for host in rules["hosts"])
+        await context.route(re.compile(rf"^https?://([^/]+\.)?({hosts})(:\d+)?/", re.IGNORECASE), abort)
+
+class BrowserManager:
+    """Keeps a single Chromium instance alive across scheduled runs.
+
+    The async Playwright API runs on an event loop owned by one dedicated
+    worker thread. Callers hand work over with run(), which gives them a fresh
+    context each time and lets them open as many pages as they need.
+    """
+
+    def __init__(self, launch_args=None, viewport=None):
+        self.launch_args = launch_args or CHROMIUM_ARGS
+        self.viewport = viewport or DEFAULT_VIEWPORT
+        self.keep_warm = False
+        # Wall-clock seconds spent in run(), launches included, in total and per calling thread
+        self.busy_seconds = 0.0
+        self._caller = threading.local()
+        # Runs using the browser, and all work in flight on the loop (worker loop only)
+        self._active_runs = 0
+        self._tasks = set()
+        self._thread = None
+        self._loop = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._browser_lock = None
+        self._playwright = None
+        self._browser = None
+
+    def _ensure_thread(self):
+        """Start the worker thread and wait for its event loop if it is not running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._worker, name="browser-manager", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    def _worker(self):
+        """Run the event loop that owns Playwright until shutdown."""
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._main())
+        except Exception as e:
+            logger.error(f"Browser manager stopped with error: {str(e)}")
+        finally:
+            # A worker started after shutdown() may already own the attribute
+            if self._loop is loop:
+                self._loop = None
+            loop.close()
+            # Unblock callers waiting in _ensure_thread if Playwright failed to start
+            self._ready.set()
+
+    async def _main(self):
+        """Start Playwright, then idle until asked to stop."""
+        # Imported on first use so that importing this module keeps web startup fast
+        from playwright.async_api import async_playwright
+        
+        async with async_playwright() as p:
+            self._playwright = p
+            self._stop = asyncio.Event()
+            self._browser_lock = asyncio.Lock()
+            self._ready.set()
+            try:
+                await self._stop.wait()
+                await self._drain()
+            finally:
+                await self._close_browser()
+                self._playwright = None
+
+    async def _drain(self):
+        """Let in-flight work finish, cancelling what is still running after the grace period (worker loop only)."""
+        pending = set(self._tasks)
+        if not pending:
+            return
+        logger.info(f"Waiting for {len(pending)} browser tasks before shutting down")
+        _, pending = await asyncio.wait(pending, timeout=SHUTDOWN_GRACE_SECONDS)
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} browser tasks still running after {SHUTDOWN_GRACE_SECONDS}s")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _submit(self, coro_fn):
+        """Schedule coro_fn() on the worker loop and return a concurrent Future.
+
+        The work is tracked so shutdown() can wait for it or cancel it; a
+        cancelled run raises CancelledError in its caller instead of hanging.
+        """
+        self._ensure_thread()
+        loop = self._loop
+        if loop is None:
+            raise RuntimeError("Browser manager failed to start Playwright")
+
+        async def tracked():
+            if self._stop.is_set():
+                raise RuntimeError("Browser manager is shutting down")
+            task = asyncio.current_task()
+            self._tasks.add(task)
+            try:
+                return await coro_fn()
+            finally:
+                self._tasks.discard(task)
+
+        return asyncio.run_coroutine_threadsafe(tracked(), loop)
+
+    async def _launch_browser(self):
+        """Launch Chromium (worker loop only)."""
+        logger.info("Launching Chromium")
+        with timed("browser_launch"):
+            self._browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args)
+        return self._browser
+
+    async def _close_browser(self):
+        """Close Chromium if it is open (worker loop only)."""
+        if self._browser is not None:
+            browser = self._browser
+            self._browser = None
+            try:
+                await browser.close()
+                logger.info("Chromium closed")
+            except Exception as e:
+                logger.warning(f"Error closing Chromium: {str(e)}")
+
+    async def _ensure_browser(self):
+        """Return a connected browser, relaunching it if it has crashed (worker loop only)."""
+        async with self._browser_lock:
+            if self._browser is not None and not self._browser.is_connected():
+                logger.warning("Chromium is no longer connected, relaunching")
+                self._browser = None
+            if self._browser is None:
+                await self._launch_browser()
+            return self._browser
+
+    def warm(self):
+        """Launch the browser ahead of the booking window and keep it alive between runs."""
+        self.keep_warm = True
+        self._submit(self._ensure_browser).result()
+        logger.info("Browser pre-warmed for booking window")
+
+    def health_check(self):
+        """Verify the browser can open a context, relaunching it on failure."""
+        async def probe():
+            browser = await self._ensure_browser()
+            try:
+                context = await browser.new_context()
+                await context.close()
+            except Exception as e:
+                logger.warning(f"Browser health check failed: {str(e)}")
+                async with self._browser_lock:
+                    await self._close_browser()
+                    browser = await self._launch_browser()
+            return browser.version
+
+        version = self._submit(probe).result()
+        logger.info(f"Browser healthy (Chromium {version})")
+        return True
+
+    def run(self, fn, block_profile="none", timeout=None, storage_state=None):
+        """Await fn(context) with a fresh context on the shared browser and return its result.
+
+        fn is an async callable; it can open several pages on the context to
+        work concurrently. block_profile names an entry of BLOCK_PROFILES.
+        storage_state optionally names a saved session file (cookies and
+        local storage) the context starts with.
+        If the browser has not been pre-warmed it is closed again once the
+        last concurrent run finishes, so ad-hoc runs outside the booking
+        window do not leave Chromium idling.
+        """
+        elapsed = [0.0]
+
+        async def task():
+            start = time.perf_counter()
+            self._active_runs += 1
+            try:
+                browser = await self._ensure_browser()
+                with timed("new_context"):
+                    context = await browser.new_context(viewport=self.viewport, storage_state=storage_state)
+                try:
+                    await apply_block_profile(context, block_profile)
+                    return await fn(context)
+                finally:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing browser context: {str(e)}")
+            finally:
+                self._active_runs -= 1
+                if not self.keep_warm and self._active_runs == 0:
+                    async with self._browser_lock:
+                        await self._close_browser()
+                elapsed[0] = time.perf_counter() - start
+                self.busy_seconds += elapsed[0]
+
+        try:
+            return self._submit(task).result(timeout)
+        finally:
+            self._caller.busy_seconds = self.thread_busy_seconds() + elapsed[0]
+
+    def thread_busy_seconds(self):
+        """Seconds spent in runs started from the calling thread, so a job can be charged its own runs only."""
+        return getattr(self._caller, "busy_seconds", 0.0)
+
+    def shutdown(self):
+        """Close the browser and stop the worker thread after the booking window.
+
+        Runs in flight get SHUTDOWN_GRACE_SECONDS to finish and are cancelled after that.
+        """
+        self.keep_warm = False
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        loop = self._loop
+        if thread is not None and thread.is_alive() and loop is not None:
+            loop.call_soon_threadsafe(self._stop.set)
+            thread.join(timeout=SHUTDOWN_GRACE_SECONDS + 30)
+            logger.info("Browser manager shut down")
+
+# Shared instance used by the scheduled checks
+shared_browser = BrowserManager()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import time
+import uuid
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Number of finished jobs kept for /jobs/<id> lookups
+JOB_HISTORY = 100
+
+def utc_timestamp():
+    return datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+class CheckJob:
+    """One queued availability check and its outcome."""
+
+    def __init__(self, key, dates, venues):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.dates = dates
+        self.venues = venues
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.attached = 0
+        self.submitted_at = utc_timestamp()
+        self.started_at = None
+        self.finished_at = None
+        # Seconds this job's own browser runs took, charged to the poll budget
+        self.browser_seconds = 0.0
+        self._submitted = time.perf_counter()
+        self._started = None
+        self._finished = None
+
+    def to_dict(self):
+        timings = {}
+        if self._started is not None:
+            timings["queued_ms"] = round((self._started - self._submitted) * 1000)
+        if self._finished is not None:
+            timings["run_ms"] = round((self._finished - self._started) * 1000)
+            timings["browser_ms"] = round(self.browser_seconds * 1000)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "dates": [date.strftime("%Y-%m-%d") for date in self.dates],
+            "venues": [venue["slug"] for venue in self.venues],
+            "result": self.result,
+            "error": self.error,
+            "attached_triggers": self.attached,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": timings
+        }
+
+class CheckJobQueue:
+    """Runs availability checks in the background, one at a time.
+
+    Submitting a check for the same dates and venues as a queued or running
+    job attaches to that job instead of starting another browser run.
+    """
+
+    def __init__(self, history=JOB_HISTORY):
+        self.history = history
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="check-job")
+
+    def submit(self, dates=None, venues=None):
+        """Queue a check (defaults as in check_court_availability) and return its job."""
+        # The checker (and its browser layer) is only imported once a check is requested
+        from tennis_booking import get_target_dates, get_venues
+        
+        dates = dates or get_target_dates()
+        venues = venues or get_venues()
+        key = (
+            tuple(sorted(date.strftime("%Y-%m-%d") for date in dates)),
+            tuple(sorted(venue["slug"] for venue in venues))
+        )
+
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                job.attached += 1
+                logger.info(f"Attached trigger to in-flight check job {job.id} ({job.status})")
+                return job
+
+            job = CheckJob(key, dates, venues)
+            self._active[key] = job
+            self._jobs[job.id] = job
+            self._prune()
+
+        logger.info(f"Queued check job {job.id} for {', '.join(key[0])} at {', '.join(key[1])}")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        from tennis_booking import check_court_availability
+        from browser_manager import shared_browser
+        
+        job.status = "running"
+        job.started_at = utc_timestamp()
+        job._started = time.perf_counter()
+        # Jobs run one at a time on this worker thread, so its runs are this job's
+        browser_before = shared_browser.thread_busy_seconds()
+        try:
+            job.result = {"notified": bool(check_court_availability(job.dates, job.venues))}
+            job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"Check job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.browser_seconds = shared_browser.thread_busy_seconds() - browser_before
+            job._finished = time.perf_counter()
+            job.finished_at = utc_timestamp()
+            with self._lock:
+                self._active.pop(job.key, None)
+            logger.info(f"Check job {job.id} {job.status} in {(job._finished - job._started) * 1000:.0f}ms")
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the history limit."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+# Shared queue used by the web endpoints and the schedulers
+check_queue = CheckJobQueue()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import socket
+import sqlite3
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lease stays valid without a heartbeat
+LEASE_TTL = float(os.getenv('SCHEDULER_LEASE_TTL', '30'))
+
+class LeaderLease:
+    """Elects one process (e.g. one gunicorn worker) as leader through a lease row in SQLite.
+
+    Every process heartbeats on a background thread: the leader renews the
+    lease, the others take it over once it has expired. on_acquire and
+    on_release are called from that thread when leadership changes.
+    """
+
+    def __init__(self, path, name="scheduler", ttl=LEASE_TTL, on_acquire=None, on_release=None):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.is_leader = False
+        self._expires_at = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Autocommit mode so BEGIN IMMEDIATE controls the write lock explicitly
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def try_acquire(self):
+        """Take or renew the lease if it is free, expired or already ours; True if held."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+            held = row is None or row[0] == self.holder or row[1] < now
+            if held:
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                    (self.name, self.holder, now + self.ttl)
+                )
+            conn.execute("COMMIT")
+            if held:
+                self._expires_at = now + self.ttl
+            return held
+        except sqlite3.Error as e:
+            logger.warning(f"Error renewing {self.name} lease: {str(e)}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            # Keep leadership only while the lease we last wrote is still valid
+            return self.is_leader and time.time() < self._expires_at
+        finally:
+            conn.close()
+
+    def release(self):
+        """Give up the lease so another process can take over immediately."""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+        except sqlite3.Error as e:
+            logger.warning(f"Error releasing {self.name} lease: {str(e)}")
+        finally:
+            conn.close()
+        self._set_leader(False)
+
+    def start(self):
+        """Start heartbeating; the first attempt to acquire happens before returning."""
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._worker, name=f"{self.name}-lease", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self.is_leader:
+            self.release()
+
+    def _worker(self):
+        # Renew well before expiry so a slow heartbeat does not hand over the lease
+        while not self._stop.wait(self.ttl / 3):
+            self._heartbeat()
+
+    def _heartbeat(self):
+        self._set_leader(self.try_acquire())
+
+    def _set_leader(self, leader):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        callback = self.on_acquire if leader else self.on_release
+        logger.info(f"{self.holder} {'acquired' if leader else 'lost'} the {self.name} lease")
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error handling {self.name} leadership change: {str(e)}")
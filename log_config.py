@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# JSON log file, rotated by size; an empty LOG_FILE logs to the console only
+LOG_FILE = os.getenv('LOG_FILE', 'tennis_booking.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '3'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Per-run context copied onto every record; asyncio tasks inherit it from their creator
+CONTEXT_VARS = {
+    "run_id": contextvars.ContextVar("run_id", default=None),
+    "venue": contextvars.ContextVar("venue", default=None),
+    "date": contextvars.ContextVar("date", default=None)
+}
+
+# Optional fields passed through extra=, e.g. by metrics.timed
+EXTRA_FIELDS = ("phase", "duration_ms")
+
+_listener = None
+
+def new_run_id():
+    return uuid.uuid4().hex[:8]
+
+@contextmanager
+def log_context(**values):
+    """Attach run_id, venue and/or date to every record logged inside the block."""
+    tokens = [(CONTEXT_VARS[name], CONTEXT_VARS[name].set(value)) for name, value in values.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto records in the logging thread."""
+
+    def filter(self, record):
+        for name, var in CONTEXT_VARS.items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the context and extra fields that are set."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in tuple(CONTEXT_VARS) + EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """Route all logging through a queue so callers never wait on console or file I/O.
+
+    Records are written on a listener thread as text to the console and as
+    JSON to a size-rotated log file. Safe to call from every entry point;
+    only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
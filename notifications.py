@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import queue
+import atexit
+import logging
+import smtplib
+import threading
+import requests
+from email.message import EmailMessage
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
+
+# (connect, read) timeout in seconds for notification requests
+HTTP_TIMEOUT = (3, 10)
+
+# Attempts per channel; HTTP channels back off on 429 and 5xx responses
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1
+
+# Maximum number of slots listed in one digest message
+DIGEST_MAX_SLOTS = 5
+
+def format_slot_line(slot_info):
+    """One-line summary of a slot for digest messages."""
+    venue = slot_info.get('venue_name')
+    prefix = f"{venue}, " if venue else ""
+    return f"{prefix}{slot_info['date']} {slot_info['start_time']}-{slot_info['end_time']}, {slot_info['court']}"
+
+def build_digest(slot_infos):
+    """Combine the matches of one run into a single notification.
+
+    The first slot is the primary match: its booking URL is the notification
+    link and its full details (including any additional message) are shown.
+    """
+    primary = slot_infos[0]
+    others = slot_infos[1:DIGEST_MAX_SLOTS]
+
+    if primary.get('booked'):
+        title = f"Tennis Court Booked: {primary['date']} at {primary['start_time']}"
+    elif others:
+        title = f"{len(slot_infos)} tennis courts available, first: {primary['date']} at {primary['start_time']}"
+    else:
+        title = f"Tennis Court Available: {primary['date']} at {primary['start_time']}"
+    message = (
+        f"Tennis court {'booked' if primary.get('booked') else 'available'} at {primary.get('venue_name', 'ClubSpark')}!\n\n"
+        f"Date: {primary['date']}\nCourt: {primary['court']}\n"
+        f"Time: {primary['start_time']} - {primary['end_time']}"
+    )
+
+    # Add additional message if provided
+    if primary.get('additional_message'):
+        message += f"\n\n{primary['additional_message']}"
+
+    if others:
+        message += "\n\nOther matching slots:\n" + "\n".join(f"- {format_slot_line(slot)}" for slot in others)
+        if len(slot_infos) > DIGEST_MAX_SLOTS:
+            message += f"\n...and {len(slot_infos) - DIGEST_MAX_SLOTS} more"
+
+    return {
+        "title": title,
+        "message": message,
+        "url": primary['booking_url'],
+        "url_title": "Book Now",
+        "slots": slot_infos
+    }
+
+def build_http_session():
+    """Return a pooled session that retries 429/5xx responses with exponential backoff."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=2, pool_maxsize=4)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class PushoverChannel:
+    """Sends notifications through the Pushover API."""
+
+    name = "pushover"
+
+    def __init__(self, user_key, api_token, session):
+        self.user_key = user_key
+        self.api_token = api_token
+        self.session = session
+
+    def send(self, notification):
+        message = notification["message"]
+
+        # Handle long URLs (Pushover has limitations on URL length)
+        booking_url = notification["url"]
+        if len(booking_url) > 500:
+            # Just keep the base URL and note that it's truncated
+            logger.warning(f"URL too long ({len(booking_url)} chars), truncating for Pushover")
+            booking_url = f"{booking_url.split('?')[0]}?...[truncated]"
+            # Add the full URL to the message body
+            message += f"\n\nFull URL (copy/paste):\n{notification['url']}"
+
+        payload = {
+            "token": self.api_token,
+            "user": self.user_key,
+            "title": notification["title"],
+            "message": message,
+            "url": booking_url,
+            "url_title": notification["url_title"],
+            "priority": 1,  # High priority
+            "sound": "pushover"  # Distinct notification sound
+        }
+        logger.debug(f"Pushover payload length: {len(str(payload))} bytes")
+
+        try:
+            response = self.session.post(PUSHOVER_API_URL, data=payload, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+        except Exception as e:
+            # For common errors, give more specific advice
+            if "400" in str(e):
+                logger.error("HTTP 400 Error: This could be due to invalid API credentials or message format")
+            elif "413" in str(e) or "too large" in str(e).lower():
+                logger.error("Message too large: Try shortening the URL or message")
+            raise
+
+class WebhookChannel:
+    """POSTs notifications as JSON to a generic webhook."""
+
+    name = "webhook"
+
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+
+    def send(self, notification):
+        payload = {key: notification[key] for key in ("title", "message", "url")}
+        payload["slots"] = notification["slots"]
+        response = self.session.post(self.url, json=payload, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+
+class SmtpChannel:
+    """Emails notifications through an SMTP relay (typically a local MTA)."""
+
+    name = "smtp"
+
+    def __init__(self, host, port, sender, recipients):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+
+    def send(self, notification):
+        email = EmailMessage()
+        email["Subject"] = notification["title"]
+        email["From"] = self.sender
+        email["To"] = ", ".join(self.recipients)
+        email.set_content(f"{notification['message']}\n\n{notification['url_title']}: {notification['url']}")
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with smtplib.SMTP(self.host, self.port, timeout=HTTP_TIMEOUT[1]) as smtp:
+                    smtp.send_message(email)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = BACKOFF_FACTOR * (2 ** attempt)
+                logger.warning(f"SMTP send failed ({str(e)}), retrying in {delay}s")
+                time.sleep(delay)
+
+class NotificationDispatcher:
+    """Sends notifications on a background thread so scanning never waits on them.
+
+    Channels are any objects with a `name` and a `send(notification)` method
+    that raises on failure; add more with add_channel().
+    """
+
+    def __init__(self, channels=None):
+        self.channels = list(channels or [])
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_channel(self, channel):
+        self.channels.append(channel)
+
+    def notify(self, slot_infos):
+        """Queue one digest notification for the given slots.
+
+        Returns a Future resolving to True if at least one channel delivered it.
+        """
+        future = Future()
+        if not self.channels:
+            logger.error("No notification channels configured. Please set PUSHOVER_USER_KEY and PUSHOVER_API_TOKEN environment variables.")
+            future.set_result(False)
+            return future
+
+        self._ensure_thread()
+        self._queue.put((build_digest(slot_infos), future))
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until queued notifications have been sent."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                logger.warning("Timed out waiting for queued notifications")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            notification, future = self._queue.get()
+            try:
+                future.set_result(self._deliver(notification))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, notification):
+        """Send a notification on every channel; True if any succeeded."""
+        delivered = False
+        for channel in self.channels:
+            try:
+                with timed(f"notify_{channel.name}"):
+                    channel.send(notification)
+                delivered = True
+                logger.info(f"Notification sent via {channel.name}: {notification['title']}")
+            except Exception as e:
+                logger.error(f"Failed to send {channel.name} notification: {str(e)}")
+        return delivered
+
+def build_dispatcher():
+    """Create a dispatcher with the channels configured in the environment."""
+    session = build_http_session()
+    dispatcher = NotificationDispatcher()
+
+    user_key = os.getenv('PUSHOVER_USER_KEY')
+    api_token = os.getenv('PUSHOVER_API_TOKEN')
+    if user_key and api_token:
+        dispatcher.add_channel(PushoverChannel(user_key, api_token, session))
+
+    webhook_url = os.getenv('NOTIFY_WEBHOOK_URL')
+    if webhook_url:
+        dispatcher.add_channel(WebhookChannel(webhook_url, session))
+
+    smtp_to = os.getenv('NOTIFY_SMTP_TO')
+    if smtp_to:
+        dispatcher.add_channel(SmtpChannel(
+            os.getenv('NOTIFY_SMTP_HOST', 'localhost'),
+            int(os.getenv('NOTIFY_SMTP_PORT', '25')),
+            os.getenv('NOTIFY_SMTP_FROM', 'tennis-booking@localhost'),
+            [address.strip() for address in smtp_to.split(',') if address.strip()]
+        ))
+
+    # Give queued notifications a chance to go out before the process exits
+    atexit.register(dispatcher.flush, 30)
+    return dispatcher
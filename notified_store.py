@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class NotifiedSlotStore:
+    """Remembers which slots have already been notified, across runs and processes.
+
+    Slots are keyed by venue, court, date and start minute. Rows are evicted
+    once their date has passed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS notified_slots (
+                    venue TEXT NOT NULL,
+                    court TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    start_minutes INTEGER NOT NULL,
+                    notified_at TEXT NOT NULL,
+                    PRIMARY KEY (venue, court, date, start_minutes)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS notified_slots_date ON notified_slots (date)")
+
+    @contextmanager
+    def _transaction(self):
+        """Yield a short-lived connection, committing on success.
+
+        A connection per call keeps the store usable from any thread.
+        """
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def slot_key(slot):
+        return (slot["venue"], slot["court"], slot["date"], slot["start_minutes"])
+
+    def filter_new(self, slots):
+        """Return the slots that have not been notified yet, preserving order."""
+        if not slots:
+            return []
+        dates = sorted({slot["date"] for slot in slots})
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT venue, court, date, start_minutes FROM notified_slots "
+                f"WHERE date IN ({', '.join('?' for _ in dates)})",
+                dates
+            ).fetchall()
+        known = set(rows)
+        return [slot for slot in slots if self.slot_key(slot) not in known]
+
+    def mark_notified(self, slots):
+        """Record slots as notified."""
+        now = datetime.datetime.utcnow().isoformat(timespec="seconds")
+        with self._lock, self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO notified_slots VALUES (?, ?, ?, ?, ?)",
+                [self.slot_key(slot) + (now,) for slot in slots]
+            )
+        logger.info(f"Recorded {len(slots)} notified slots")
+
+    def evict_expired(self, today):
+        """Delete slots dated before today (a YYYY-MM-DD string)."""
+        with self._lock, self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM notified_slots WHERE date < ?", (today,)).rowcount
+        if deleted:
+            logger.info(f"Evicted {deleted} notified slots for past dates")
+        return deleted
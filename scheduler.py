@@ -3,71 +3,71 @@
 import os
 import time
 import logging
-import datetime
-import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from tennis_booking import check_court_availability
+from browser_manager import shared_browser
+from adaptive_poller import adaptive_poller, POLL_TICK_SECONDS
+from sniper import run_sniper
+from auth_session import auth_session
+from log_config import setup_logging
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('scheduler.log')
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-def is_within_booking_window():
-    """Check if current time is within the booking window (9:55 PM - 10:05 PM UK time)."""
-    london_tz = pytz.timezone('Europe/London')
-    now = datetime.datetime.now(london_tz)
-    
-    # Define the booking window
-    start_hour, start_minute = 21, 55  # 9:55 PM
-    end_hour, end_minute = 22, 5       # 10:05 PM
-    
-    # Current time in hours and minutes
-    current_hour, current_minute = now.hour, now.minute
-    
-    # Check if current time is within the booking window
-    if current_hour == start_hour and current_minute >= start_minute:
-        return True
-    if current_hour == end_hour and current_minute <= end_minute:
-        return True
-    
-    return False
-
-def scheduled_job():
-    """Wrapper for the check_court_availability function that only runs during the booking window."""
-    logger.info("Scheduled job triggered")
-    
-    if is_within_booking_window():
-        logger.info("Current time is within booking window, executing court availability check")
-        check_court_availability()
-    else:
-        logger.info("Current time is outside booking window, skipping court availability check")
-
 def main():
     logger.info("Starting the tennis court booking scheduler")
     
     # Create a scheduler
     scheduler = BackgroundScheduler()
     
-    # Schedule the job to run every minute
+    # Check each target date at its own adaptive interval, tightest around the release
     scheduler.add_job(
-        scheduled_job,
-        trigger=CronTrigger(minute='*'),  # Run every minute
+        adaptive_poller.tick,
+        trigger='interval',
+        seconds=POLL_TICK_SECONDS,
         id='check_court_availability',
-        name='Check tennis court availability',
+        name='Poll tennis court availability',
+        replace_existing=True
+    )
+    
+    # Keep the browser warm through the booking window
+    scheduler.add_job(
+        shared_browser.warm,
+        trigger=CronTrigger(hour=21, minute=50, timezone='Europe/London'),
+        id='warm_browser',
+        name='Pre-warm the browser',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        shared_browser.shutdown,
+        trigger=CronTrigger(hour=22, minute=10, timezone='Europe/London'),
+        id='shutdown_browser',
+        name='Close the browser after the window',
+        replace_existing=True
+    )
+    
+    # Make sure the saved ClubSpark session is signed in well before the window
+    scheduler.add_job(
+        auth_session.refresh,
+        trigger=CronTrigger(hour=21, minute=45, timezone='Europe/London'),
+        id='refresh_auth_session',
+        name='Validate the signed-in ClubSpark session',
+        replace_existing=True
+    )
+    
+    # Poll the parked booking sheets tightly around the 10 PM release
+    scheduler.add_job(
+        run_sniper,
+        trigger=CronTrigger(hour=21, minute=58, timezone='Europe/London'),
+        id='release_sniper',
+        name='Snipe slots at release time',
         replace_existing=True
     )
     
     # Start the scheduler
     scheduler.start()
-    logger.info("Scheduler started, waiting for booking window")
+    logger.info("Scheduler started, polling adaptively")
     
     try:
         # Keep the script running
@@ -76,6 +76,7 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         # Shut down the scheduler gracefully
         scheduler.shutdown()
+        shared_browser.shutdown()
         logger.info("Scheduler shut down")
 
 if __name__ == "__main__":
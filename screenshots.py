@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Run modes that take screenshots ("check", "sniper"); empty disables them
+SCREENSHOT_MODES = [
+    mode.strip() for mode in os.getenv('SCREENSHOT_MODES', 'check').split(',') if mode.strip()
+]
+
+# Ring directory, bounded by file count and total size
+SCREENSHOT_DIR = os.getenv('SCREENSHOT_DIR', 'screenshots')
+SCREENSHOT_MAX_FILES = int(os.getenv('SCREENSHOT_MAX_FILES', '50'))
+SCREENSHOT_MAX_BYTES = int(os.getenv('SCREENSHOT_MAX_BYTES', str(20 * 1024 * 1024)))
+
+# JPEG quality and the top-left region (WIDTHxHEIGHT) that is captured
+SCREENSHOT_QUALITY = int(os.getenv('SCREENSHOT_QUALITY', '60'))
+SCREENSHOT_CLIP = os.getenv('SCREENSHOT_CLIP', '1280x800')
+
+# Screenshots waiting to be written; more are dropped rather than queued
+QUEUE_SIZE = 16
+
+def parse_clip(value):
+    width, height = (int(part) for part in value.lower().split("x"))
+    return {"x": 0, "y": 0, "width": width, "height": height}
+
+class ScreenshotPipeline:
+    """Captures small JPEG screenshots and writes them to a ring directory on a background thread."""
+
+    def __init__(self, directory=SCREENSHOT_DIR, modes=SCREENSHOT_MODES, max_files=SCREENSHOT_MAX_FILES,
+                 max_bytes=SCREENSHOT_MAX_BYTES, quality=SCREENSHOT_QUALITY, clip=SCREENSHOT_CLIP):
+        self.directory = directory
+        self.modes = set(modes)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.clip = parse_clip(clip)
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enabled_for(self, mode):
+        return mode in self.modes
+
+    async def capture(self, page, name, mode="check"):
+        """Screenshot the page if mode takes screenshots; only the capture itself is awaited."""
+        if not self.enabled_for(mode):
+            return
+        try:
+            with timed("screenshot"):
+                data = await page.screenshot(type="jpeg", quality=self.quality, clip=self.clip)
+        except Exception as e:
+            logger.warning(f"Could not take screenshot {name}: {str(e)}")
+            return
+        self.submit(name, data)
+
+    def submit(self, name, data):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((name, data))
+        except queue.Full:
+            logger.warning(f"Screenshot queue full, dropping {name}")
+
+    def flush(self, timeout=None):
+        """Wait until queued screenshots have been written."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="screenshot-writer", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            name, data = self._queue.get()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{name}.jpg")
+                with open(path, "wb") as f:
+                    f.write(data)
+                logger.info(f"Saved screenshot to {path} ({len(data) // 1024} KB)")
+                self._prune()
+            except Exception as e:
+                logger.error(f"Error writing screenshot {name}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        """Delete the oldest screenshots until the directory is within its bounds."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_files or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total -= size
+
+# Shared pipeline configured from the environment
+screenshots = ScreenshotPipeline()
+
+# Let queued screenshots reach the disk before the process exits
+atexit.register(screenshots.flush, 10)
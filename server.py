@@ -1,24 +1,24 @@
-from flask import Flask
+from flask import Flask, Response, request
 import os
 import logging
+import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
-from tennis_booking import check_court_availability
+from check_jobs import check_queue
+from adaptive_poller import adaptive_poller, POLL_TICK_SECONDS
+from browser_manager import shared_browser
+from leader_lease import LeaderLease
+from metrics import registry, CONTENT_TYPE
 import pytz
 import sys
 import subprocess
+from log_config import setup_logging
 
 # Set Playwright browsers path if not already set
 if 'PLAYWRIGHT_BROWSERS_PATH' not in os.environ:
     os.environ['PLAYWRIGHT_BROWSERS_PATH'] = os.path.join(os.path.expanduser('~'), 'pw-browsers')
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -27,6 +27,23 @@ app = Flask(__name__)
 scheduler = BackgroundScheduler()
 scheduler_started = False
 
+# Only the worker holding this lease runs the scheduled jobs; the others take over if it dies
+scheduler_lease = LeaderLease(
+    os.getenv('SCHEDULER_LEASE_DB', 'scheduler_lease.db'),
+    on_acquire=lambda: scheduler.resume(),
+    on_release=lambda: scheduler.pause()
+)
+
+def run_release_sniper():
+    """Run sniper mode, importing it (and the browser layer) only when the job fires."""
+    from sniper import run_sniper
+    run_sniper()
+
+def refresh_auth_session():
+    """Validate (or renew) the signed-in ClubSpark session, importing it only when the job fires."""
+    from auth_session import auth_session
+    auth_session.refresh()
+
 # Schedule the job to run daily at a specific time (UK time)
 def schedule_job():
     global scheduler_started
@@ -34,16 +51,24 @@ def schedule_job():
         return
         
     uk_timezone = pytz.timezone('Europe/London')
-    # Run at 9:55 PM UK time
-    scheduler.add_job(check_court_availability, 'cron', hour=21, minute=55, timezone=uk_timezone)
-    # Run at 10:00 PM UK time
-    scheduler.add_job(check_court_availability, 'cron', hour=22, minute=0, timezone=uk_timezone)
-    # Run at 10:05 PM UK time
-    scheduler.add_job(check_court_availability, 'cron', hour=22, minute=5, timezone=uk_timezone)
+    # Make sure the saved ClubSpark session is signed in well before the window
+    scheduler.add_job(refresh_auth_session, 'cron', hour=21, minute=45, timezone=uk_timezone)
+    # Pre-warm the browser at 9:50 PM UK time so the checks skip the cold launch
+    scheduler.add_job(shared_browser.warm, 'cron', hour=21, minute=50, timezone=uk_timezone)
+    # Make sure the warm browser is still usable just before release
+    scheduler.add_job(shared_browser.health_check, 'cron', hour=21, minute=58, timezone=uk_timezone)
+    # Park the booking sheets at 9:58 PM UK time and poll them through the 10 PM release
+    scheduler.add_job(run_release_sniper, 'cron', hour=21, minute=58, timezone=uk_timezone)
+    # Check each target date at its own adaptive interval, tightest around the release
+    scheduler.add_job(adaptive_poller.tick, 'interval', seconds=POLL_TICK_SECONDS)
+    # Close the browser once the booking window is over
+    scheduler.add_job(shared_browser.shutdown, 'cron', hour=22, minute=10, timezone=uk_timezone)
     
-    scheduler.start()
+    # Start paused; the jobs only run while this worker holds the scheduler lease
+    scheduler.start(paused=True)
     scheduler_started = True
-    logger.info("Scheduler started with jobs")
+    scheduler_lease.start()
+    logger.info(f"Scheduler started with jobs ({'leader' if scheduler_lease.is_leader else 'standby'})")
 
 # Start the scheduler with app
 with app.app_context():
@@ -53,6 +78,17 @@ with app.app_context():
     except Exception as e:
         logger.error(f"Error scheduling jobs during initialization: {str(e)}")
 
+def parse_check_args(args):
+    """Read the optional date (YYYY-MM-DD) and venue query parameters, comma-separated."""
+    from tennis_booking import get_venues
+    
+    dates = [
+        datetime.datetime.strptime(value.strip(), "%Y-%m-%d")
+        for value in args.get('date', '').split(',') if value.strip()
+    ]
+    venues = get_venues([value.strip() for value in args.get('venue', '').split(',') if value.strip()])
+    return dates or None, venues
+
 # Health check endpoint
 @app.route('/')
 def health_check():
@@ -61,20 +97,76 @@ def health_check():
         "message": "Tennis booking service running"
     }
 
-# Manual trigger endpoint
+# Manual trigger endpoint; the check runs in the background
 @app.route('/run-check', methods=['GET'])
 def run_check():
     try:
-        check_court_availability()
+        dates, venues = parse_check_args(request.args)
+    except ValueError as e:
         return {
-            "status": "success",
-            "message": "Court availability check triggered manually"
-        }
+            "status": "error",
+            "message": f"Invalid date: {str(e)}"
+        }, 400
+    
+    try:
+        job = check_queue.submit(dates, venues)
+        return {
+            "status": "queued",
+            "message": "Court availability check triggered manually",
+            "job_id": job.id,
+            "job_status": job.status,
+            "status_url": f"/jobs/{job.id}"
+        }, 202
     except Exception as e:
         return {
             "status": "error",
-            "message": f"Error running court availability check: {str(e)}"
-        }
+            "message": f"Error queueing court availability check: {str(e)}"
+        }, 500
+
+# Prometheus metrics of this worker
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+# Status and result of a queued check
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = check_queue.get(job_id)
+    if job is None:
+        return {
+            "status": "error",
+            "message": f"Unknown job {job_id}"
+        }, 404
+    return job.to_dict()
+
+# Poll intervals of the target dates and the poll budget use of this worker
+@app.route('/poller', methods=['GET'])
+def poller_status():
+    return adaptive_poller.status()
+
+# Aggregate queries over the availability history
+@app.route('/history/<query>', methods=['GET'])
+def history(query):
+    from availability_history import QUERIES, history_store
+    
+    if query not in QUERIES:
+        return {
+            "status": "error",
+            "message": f"Unknown query {query}, expected one of {', '.join(sorted(QUERIES))}"
+        }, 404
+    try:
+        days = int(request.args.get('days', '30'))
+    except ValueError:
+        return {
+            "status": "error",
+            "message": "days must be a whole number"
+        }, 400
+    return {
+        "query": query,
+        "venue": request.args.get('venue'),
+        "days": days,
+        "result": QUERIES[query](history_store, request.args.get('venue'), days)
+    }
 
 if __name__ == "__main__":
     # Start the Flask app
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+Release-time "sniper" mode.
+
+Slots for the day six days ahead open at 22:00 UK time. This mode parks the
+booking sheet of every enabled venue before the release, estimates how far the
+local clock is from ClubSpark's, and re-reads the sheet's data in a tight loop
+(without navigating) from a few seconds before the release until a newly
+opened matching slot appears, which is then notified through the normal flow.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import datetime
+import statistics
+import pytz
+import requests
+from email.utils import parsedate_to_datetime
+from availability_api import AvailabilityShapeError, availability_client, parse_sessions_json, with_date, with_venue
+from availability_grid import AvailabilityGrid, touches
+from browser_manager import shared_browser
+from metrics import timed
+from log_config import log_context, new_run_id
+from tennis_booking import (
+    BLOCK_PROFILE, BOOKING_LINKS, CLUBSPARK_URL, get_target_date, get_venues, get_venue_settings,
+    get_day_type, get_booking_url, format_date_for_url, load_booking_sheet,
+    extract_slots, rank_slots, find_candidates, select_candidates, notify_best, booking_storage_state,
+    grid_store, record_history
+)
+
+logger = logging.getLogger(__name__)
+
+# Release time of new slots (UK time)
+RELEASE_HOUR, RELEASE_MINUTE = 22, 0
+
+# Start polling this many seconds before the release
+SNIPE_LEAD_SECONDS = float(os.getenv('SNIPE_LEAD_SECONDS', '5'))
+
+# Delay between sheet reads while polling
+SNIPE_INTERVAL = float(os.getenv('SNIPE_INTERVAL', '0.25'))
+
+# Give up this many seconds after the release
+SNIPE_WINDOW_SECONDS = float(os.getenv('SNIPE_WINDOW_SECONDS', '300'))
+
+# Seconds between availability history records of a polled sheet, so the
+# history sees about one scan a minute rather than every read
+SNIPE_HISTORY_SECONDS = 60
+
+# Number of Date header samples used for the clock offset estimate
+CLOCK_SAMPLES = 5
+
+# Re-requests the sheet's data from inside the page, reusing its cookies
+FETCH_SESSIONS_JS = """async url => {
+    const response = await fetch(url, {credentials: 'include', headers: {'X-Requested-With': 'XMLHttpRequest'}});
+    if (!response.ok) {
+        throw new Error('HTTP ' + response.status);
+    }
+    return await response.json();
+}"""
+
+def estimate_clock_offset(url=CLUBSPARK_URL, samples=CLOCK_SAMPLES):
+    """Estimate server time minus local time (seconds) from the server's Date header.
+
+    The Date header has one-second resolution, so each sample is taken as the
+    middle of that second, matched against the midpoint of the request's
+    round trip; the median of the samples is returned.
+    """
+    session = requests.Session()
+    offsets = []
+    for _ in range(samples):
+        try:
+            sent = time.time()
+            response = session.head(url, timeout=5, allow_redirects=False)
+            received = time.time()
+            server_time = parsedate_to_datetime(response.headers["Date"]).timestamp() + 0.5
+            offsets.append(server_time - (sent + received) / 2)
+        except Exception as e:
+            logger.warning(f"Clock offset sample failed: {str(e)}")
+
+    if not offsets:
+        logger.warning("Could not estimate clock offset, assuming the local clock is correct")
+        return 0.0
+
+    offset = statistics.median(offsets)
+    logger.info(f"Estimated clock offset against {url}: {offset * 1000:+.0f}ms ({len(offsets)} samples)")
+    return offset
+
+def get_release_timestamp():
+    """Return today's release time (22:00 UK) as a Unix timestamp."""
+    london_tz = pytz.timezone('Europe/London')
+    now = datetime.datetime.now(london_tz)
+    release = london_tz.localize(datetime.datetime(now.year, now.month, now.day, RELEASE_HOUR, RELEASE_MINUTE))
+    return release.timestamp()
+
+async def read_sheet(page, venue, date_str):
+    """Re-read the parked sheet's open slots without navigating.
+
+    Uses the sheet's own data endpoint from inside the page when it is known,
+    otherwise reloads the page and extracts the slots from the DOM.
+    """
+    if availability_client.is_ready():
+        url = with_date(with_venue(availability_client.endpoint_url, venue["slug"]), date_str)
+        with timed("sheet_refetch"):
+            data = await page.evaluate(FETCH_SESSIONS_JS, url)
+        return parse_sessions_json(data, date_str)
+
+    logger.warning("Availability endpoint unknown, falling back to reloading the sheet")
+    await load_booking_sheet(page, get_booking_url(venue["slug"], date_str))
+    return await extract_slots(page)
+
+async def snipe_venue(context, venue, target_date, release_ts, offset):
+    """Park one venue's sheet, poll it around the release and notify the first match."""
+    date_str = format_date_for_url(target_date)
+    day_type = get_day_type(target_date)
+    settings = get_venue_settings(venue)
+    server_now = lambda: time.time() + offset
+
+    # Park the sheet ahead of the release, recording its data request on the way
+    page = await context.new_page()
+    page.on("response", availability_client.capture)
+    try:
+        await load_booking_sheet(page, get_booking_url(venue["slug"], date_str))
+    except Exception as e:
+        # The unreleased sheet may render no sessions yet; its data is what gets polled
+        logger.warning(f"Parked {venue['name']} sheet has not rendered: {str(e)}")
+    logger.info(f"Parked {venue['name']} sheet for {date_str}, release in {release_ts - server_now():.1f}s")
+
+    await asyncio.sleep(max(0, release_ts - SNIPE_LEAD_SECONDS - server_now()))
+
+    # Reads are diffed in memory; only a newly opened matching slot goes on to the stored grid and notified slots
+    previous = grid_store.load(venue["slug"], date_str)
+    recorded_at = 0.0
+    reads = 0
+    while server_now() < release_ts + SNIPE_WINDOW_SECONDS:
+        try:
+            slots = await read_sheet(page, venue, date_str)
+            reads += 1
+        except AvailabilityShapeError as e:
+            logger.warning(f"Sheet data changed shape ({str(e)}), reloading the sheet instead")
+            availability_client.reset()
+            slots = None
+        except Exception as e:
+            logger.warning(f"Error re-reading {venue['name']} sheet: {str(e)}")
+            slots = None
+
+        # A failed read says nothing about the sheet, so it is neither diffed nor recorded
+        if slots is not None:
+            grid = AvailabilityGrid.from_slots(venue["slug"], date_str, slots)
+            opened, _ = grid.diff(previous)
+            previous = grid
+
+            if any(touches(slot, opened) for slot in rank_slots(slots, day_type, settings)):
+                # select_candidates records this read in the history
+                recorded_at = time.time()
+                if BOOKING_LINKS == "synthesize":
+                    # The fresh data carries everything the booking links need, so skip the DOM
+                    candidates = select_candidates(slots, venue, target_date, source="http")
+                    held = None
+                else:
+                    # Load the DOM view once so the slot can be clicked through
+                    candidates = await find_candidates(page, venue, target_date)
+                    held = {"best": candidates[0] if candidates else None, "page": page}
+
+                # Slots that were already notified keep the loop polling
+                if candidates:
+                    detected_ts = server_now()
+                    logger.info(
+                        f"New matching slot detected at {venue['name']} for {date_str} "
+                        f"{(detected_ts - release_ts) * 1000:+.0f}ms from release ({reads} reads)"
+                    )
+                    if held is None:
+                        await page.close()
+                    return await notify_best(context, candidates, held, mode="sniper")
+            elif time.time() - recorded_at >= SNIPE_HISTORY_SECONDS:
+                record_history(venue, date_str, slots)
+                recorded_at = time.time()
+
+        await asyncio.sleep(SNIPE_INTERVAL)
+
+    logger.info(f"No matching slot appeared at {venue['name']} for {date_str} ({reads} reads)")
+    await page.close()
+    return False
+
+async def snipe(context, venues, target_date):
+    """Snipe every venue concurrently."""
+    offset = await asyncio.to_thread(estimate_clock_offset)
+    release_ts = get_release_timestamp()
+    
+    async def snipe_logged(venue):
+        with log_context(venue=venue["slug"], date=format_date_for_url(target_date)):
+            return await snipe_venue(context, venue, target_date, release_ts, offset)
+    
+    return await asyncio.gather(*(snipe_logged(venue) for venue in venues))
+
+def run_sniper():
+    """Run sniper mode for the newly released date at every enabled venue."""
+    logger.info("Starting release sniper")
+    try:
+        with log_context(run_id=new_run_id()):
+            shared_browser.run(
+                lambda context: snipe(context, get_venues(), get_target_date()),
+                block_profile=BLOCK_PROFILE,
+                storage_state=booking_storage_state()
+            )
+    except Exception as e:
+        logger.error(f"Error in release sniper: {str(e)}")
+    finally:
+        logger.info("Release sniper finished")
+
+if __name__ == "__main__":
+    run_sniper()
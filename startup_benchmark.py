@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""
+Startup benchmark for the web process.
+
+Measures how long importing server:app takes (and checks that the browser
+layer is not imported with it), then how long a cold gunicorn start takes
+until the health check answers. Exits non-zero when a median exceeds its
+budget.
+
+    python startup_benchmark.py
+    python startup_benchmark.py --runs 10 --import-budget-ms 800
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default budgets for the median import and cold-start times
+IMPORT_BUDGET_MS = 1000
+STARTUP_BUDGET_MS = 3000
+
+# Modules that must only load on the first scan
+HEAVY_MODULES = ("playwright", "tennis_booking", "sniper", "requests", "dotenv")
+
+# Imports server in a fresh interpreter and reports the time and heavy modules loaded
+IMPORT_PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+import server
+elapsed_ms = (time.perf_counter() - start) * 1000
+heavy = sorted(name for name in sys.modules if name.split('.')[0] in {HEAVY_MODULES!r})
+print(json.dumps({{"import_ms": elapsed_ms, "heavy_modules": heavy}}))
+"""
+
+def probe_env():
+    """Environment for child processes: the repo on the path, no log file."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BASE_DIR, env.get("PYTHONPATH")]))
+    env["LOG_FILE"] = ""
+    return env
+
+def measure_import(workdir):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=workdir, env=probe_env(),
+        capture_output=True, text=True, timeout=60
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing server failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(workdir, count=10):
+    """Return the (cumulative ms, module) pairs of server's own imports that dominate `import server`.
+
+    -X importtime prints each module after the modules it imports, indented
+    two spaces per nesting level, so server's direct imports are the
+    one-level entries listed just before server itself.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"], cwd=workdir, env=probe_env(),
+        capture_output=True, text=True, timeout=60
+    )
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == "server":
+                return sorted(children, reverse=True)[:count]
+            children = []
+    return []
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_cold_start(workdir, timeout=60):
+    """Start gunicorn and return the ms until GET / answers 200."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "server:app", "--bind", f"127.0.0.1:{port}", "--workers", "1"],
+        cwd=workdir, env=probe_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"No healthy response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure web process import and cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="measurements of each kind (default: 5)")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--skip-cold-start", action="store_true", help="only measure the import")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="tennis-startup-") as workdir:
+        probes = [measure_import(workdir) for _ in range(args.runs)]
+        import_ms = [probe["import_ms"] for probe in probes]
+        print(f"import server: median {statistics.median(import_ms):.0f}ms, max {max(import_ms):.0f}ms (budget {args.import_budget_ms:.0f}ms)")
+        for cumulative_ms, name in slowest_imports(workdir):
+            print(f"  {cumulative_ms:8.1f}ms  {name}")
+
+        heavy = sorted({name for probe in probes for name in probe["heavy_modules"]})
+        if heavy:
+            failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+        if statistics.median(import_ms) > args.import_budget_ms:
+            failures.append("import time over budget")
+
+        if not args.skip_cold_start:
+            startup_ms = [measure_cold_start(workdir) for _ in range(args.runs)]
+            print(f"cold start to first healthy response: median {statistics.median(startup_ms):.0f}ms, max {max(startup_ms):.0f}ms (budget {args.startup_budget_ms:.0f}ms)")
+            if statistics.median(startup_ms) > args.startup_budget_ms:
+                failures.append("cold start over budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
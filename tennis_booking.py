@@ -7,31 +7,73 @@ import datetime
 import pytz
 import requests
 import asyncio
+from urllib.parse import urljoin
+from array import array
 from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright
+from browser_manager import shared_browser
+from availability_api import availability_client, AvailabilityShapeError
+from notifications import build_dispatcher
+from notified_store import NotifiedSlotStore
+from availability_grid import AvailabilityGrid, GridSnapshotStore, touches
+from metrics import PHASE_SECONDS, SLOTS, timed, record_error
+from screenshots import screenshots
+from log_config import setup_logging, log_context, new_run_id
+from auth_session import auth_session
+from availability_history import history_store
+from booking_links import booking_link_template
 import re
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('tennis_booking.log')
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Pushover configuration
-PUSHOVER_USER_KEY = os.getenv('PUSHOVER_USER_KEY')
-PUSHOVER_API_TOKEN = os.getenv('PUSHOVER_API_TOKEN')
-PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
+# Notification channels (Pushover, webhook, SMTP) configured from the environment
+notifier = build_dispatcher()
+
+# Slots that have already been notified, so repeat runs skip them
+notified_store = NotifiedSlotStore(os.getenv('NOTIFIED_DB_PATH', 'notified_slots.db'))
+
+# Last seen availability grid per venue and date, used to diff successive runs
+grid_store = GridSnapshotStore(os.getenv('GRID_DB_PATH', 'availability_grids.db'))
 
 # Tennis court booking configuration
-BASE_URL = "https://clubspark.lta.org.uk/ClissoldParkHackney/Booking/BookByDate"
+CLUBSPARK_URL = "https://clubspark.lta.org.uk"
+
+# Known venues. "overrides" may replace "preferences", "max_duration" and
+# "preferred_courts" for that venue only.
+VENUES = [
+    {"slug": "ClissoldParkHackney", "name": "Clissold Park", "overrides": {}},
+    {"slug": "LondonFieldsPark", "name": "London Fields Park", "overrides": {}}
+]
+
+# Venues scanned on each run (comma-separated slugs)
+ENABLED_VENUES = [
+    slug.strip() for slug in os.getenv('VENUES', 'ClissoldParkHackney').split(',') if slug.strip()
+]
+
+# "http" polls the booking sheet's data endpoint directly once it is known,
+# "browser" always renders the page with Playwright
+AVAILABILITY_MODE = os.getenv('AVAILABILITY_MODE', 'http').lower()
+
+# Number of days scanned, counting back from 6 days ahead (1 = only the newly released day)
+SCAN_DAYS = int(os.getenv('SCAN_DAYS', '7'))
+
+# Maximum number of booking sheets loaded at the same time
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', '3'))
+
+# Resource blocking profile for the booking page (see browser_manager.BLOCK_PROFILES)
+BLOCK_PROFILE = os.getenv('BLOCK_PROFILE', 'lean').lower()
+
+# Load state passed to page.goto; readiness is then decided by SHEET_READY_SELECTOR.
+# Set to "networkidle" to compare against the old behaviour.
+PAGE_WAIT_UNTIL = os.getenv('PAGE_WAIT_UNTIL', 'domcontentloaded')
+
+# The sheet is rendered client-side: .booking-sheet exists before its sessions
+# arrive, so readiness is its first rendered session cell (booked or not)
+SHEET_READY_SELECTOR = ".booking-sheet .resource-session"
 
 # Time preferences
 PREFERENCES = {
@@ -40,6 +82,20 @@ PREFERENCES = {
     "weekend": [(8*60, 22*60)]  # Any time (max 2 hours)
 }
 
+# Courts in order of preference, used to rank equally good time slots
+PREFERRED_COURTS = [
+    court.strip() for court in os.getenv('PREFERRED_COURTS', '').split(',') if court.strip()
+]
+
+# How notification links are made: "synthesize" builds the booking form link from
+# the slot's metadata without any clicks, once the link format has been learned
+# from a click-through (clicking through until then); "click" always clicks through
+BOOKING_LINKS = os.getenv('BOOKING_LINKS', 'synthesize').lower()
+
+# Book the notified slot through to confirmation with the saved signed-in
+# session (see auth_session.py) once its notification is queued; off by default
+AUTO_BOOK = os.getenv('AUTO_BOOK', 'false').lower() == 'true'
+
 # Maximum booking duration in minutes
 MAX_DURATION = {
     "wednesday": 60,  # 1 hour for morning slots, 2 hours for afternoon
@@ -47,6 +103,33 @@ MAX_DURATION = {
     "weekend": 120    # 2 hours max for weekends
 }
 
+MINUTES_PER_DAY = 24 * 60
+
+# PreferenceIndex per (venue settings key, day type), filled on first use
+COMPILED_PREFERENCES = {}
+
+def get_venues(slugs=None):
+    """Return the venue entries to scan; unknown slugs get a bare entry."""
+    known = {venue["slug"]: venue for venue in VENUES}
+    return [
+        known.get(slug, {"slug": slug, "name": slug, "overrides": {}})
+        for slug in (slugs or ENABLED_VENUES)
+    ]
+
+def get_venue_settings(venue):
+    """Return the matching settings for a venue, with its overrides applied."""
+    overrides = venue.get("overrides", {})
+    return {
+        "key": venue.get("slug", "default"),
+        "preferences": {**PREFERENCES, **overrides.get("preferences", {})},
+        "max_duration": {**MAX_DURATION, **overrides.get("max_duration", {})},
+        "preferred_courts": overrides.get("preferred_courts", PREFERRED_COURTS)
+    }
+
+def get_booking_url(venue_slug, date_str):
+    """Return the booking sheet URL for a venue and date."""
+    return f"{CLUBSPARK_URL}/{venue_slug}/Booking/BookByDate#?date={date_str}"
+
 def get_target_date():
     """Get the date 6 days from now."""
     london_tz = pytz.timezone('Europe/London')
@@ -54,6 +137,13 @@ def get_target_date():
     target_date = now + datetime.timedelta(days=6)
     return target_date
 
+def get_target_dates(days=None):
+    """Get the dates to scan: the last `days` days up to and including 6 days from now."""
+    if days is None:
+        days = SCAN_DAYS
+    target_date = get_target_date()
+    return [target_date - datetime.timedelta(days=offset) for offset in reversed(range(days))]
+
 def format_date_for_url(date):
     """Format the date for the URL parameter."""
     return date.strftime("%Y-%m-%d")
@@ -68,43 +158,154 @@ def get_day_type(date):
     else:  # Saturday-Sunday (5-6)
         return "weekend"
 
-def is_time_in_preferences(day_type, start_minutes, end_minutes):
-    """Check if the time slot fits the user's preferences."""
-    if day_type not in PREFERENCES:
-        return False
-    
-    duration = end_minutes - start_minutes
-    
+def max_duration_for(day_type, start_minutes, max_durations):
+    """Return the longest booking allowed for a slot starting at start_minutes."""
     # Special handling for Wednesday with different max durations for morning vs afternoon
     if day_type == "wednesday":
         # Morning slot (8:00-9:00)
         if 8*60 <= start_minutes < 9*60:
-            max_duration = 60  # 1 hour max for morning
+            return 60  # 1 hour max for morning
         # Afternoon slot (12:00-14:00)
         elif 12*60 <= start_minutes < 14*60:
-            max_duration = 120  # 2 hours max for afternoon
+            return 120  # 2 hours max for afternoon
         else:
-            max_duration = MAX_DURATION.get(day_type, 60)
-    else:
-        max_duration = MAX_DURATION.get(day_type, 120)
+            return max_durations.get(day_type, 60)
+    return max_durations.get(day_type, 120)
+
+class PreferenceIndex:
+    """A day type's preferences compiled to minute resolution.
+
+    covered[m] counts the minutes before m that fall inside a preference
+    window, so a slot overlaps a window exactly when covered[end] > covered[start].
+    max_duration[m] is the longest booking allowed for a slot starting at m.
+    """
+
+    __slots__ = ("covered", "max_duration", "longest")
+
+    def __init__(self, windows, max_durations_at):
+        in_window = bytearray(MINUTES_PER_DAY)
+        for start_pref, end_pref in windows:
+            for minute in range(max(start_pref, 0), min(end_pref, MINUTES_PER_DAY)):
+                in_window[minute] = 1
+        
+        self.covered = array('H', [0]) * (MINUTES_PER_DAY + 1)
+        for minute in range(MINUTES_PER_DAY):
+            self.covered[minute + 1] = self.covered[minute] + in_window[minute]
+        
+        self.max_duration = array('H', max_durations_at)
+        self.longest = max(self.max_duration) if windows else 0
+
+    def matches(self, start_minutes, end_minutes):
+        """Check a slot against the compiled preferences in constant time."""
+        if not 0 <= start_minutes < end_minutes <= MINUTES_PER_DAY:
+            return False
+        if end_minutes - start_minutes > self.max_duration[start_minutes]:
+            return False
+        return self.covered[end_minutes] > self.covered[start_minutes]
+
+def compile_preferences(day_type, settings=None):
+    """Build the PreferenceIndex for a day type from settings (or the global preferences)."""
+    preferences = settings["preferences"] if settings else PREFERENCES
+    max_durations = settings["max_duration"] if settings else MAX_DURATION
     
-    # Check if the duration is acceptable
-    if duration > max_duration:
-        return False
+    return PreferenceIndex(
+        preferences.get(day_type, []),
+        [max_duration_for(day_type, minute, max_durations) for minute in range(MINUTES_PER_DAY)]
+    )
+
+def get_preference_index(day_type, settings=None):
+    """Return the compiled preferences for a day type, compiling them on first use."""
+    key = (settings["key"] if settings else "default", day_type)
+    if key not in COMPILED_PREFERENCES:
+        COMPILED_PREFERENCES[key] = compile_preferences(day_type, settings)
+    return COMPILED_PREFERENCES[key]
+
+def is_time_in_preferences(day_type, start_minutes, end_minutes, settings=None):
+    """Check if the time slot fits the user's preferences.
+
+    settings (from get_venue_settings) replaces the global preferences.
+    """
+    return get_preference_index(day_type, settings).matches(start_minutes, end_minutes)
+
+def coalesce_slots(slots, max_minutes):
+    """Add runs of back-to-back free slots on the same court, up to max_minutes long.
+
+    Returns the original slots plus one record per run of two or more
+    adjacent slots. A run keeps the first slot's identity (so clicking it
+    starts the booking there) and lists its members in "run_test_ids".
+    """
+    by_court = {}
+    for slot in slots:
+        if slot["start_minutes"] is None or slot["end_minutes"] is None:
+            continue
+        by_court.setdefault(slot["resource_id"] or slot["court"], []).append(slot)
     
-    # Check if the time slot is within preferred hours
-    for start_pref, end_pref in PREFERENCES[day_type]:
-        # Time slot starts within the preference window
-        if start_pref <= start_minutes < end_pref:
-            return True
-        # Time slot ends within the preference window
-        if start_pref < end_minutes <= end_pref:
-            return True
-        # Time slot completely contains the preference window
-        if start_minutes <= start_pref and end_minutes >= end_pref:
-            return True
+    runs = []
+    for court_slots in by_court.values():
+        court_slots.sort(key=lambda slot: slot["start_minutes"])
+        for i, first in enumerate(court_slots):
+            end_minutes = first["end_minutes"]
+            members = [first]
+            for following in court_slots[i + 1:]:
+                if following["start_minutes"] != end_minutes:
+                    break
+                if following["end_minutes"] - first["start_minutes"] > max_minutes:
+                    break
+                end_minutes = following["end_minutes"]
+                members.append(following)
+                runs.append({
+                    **first,
+                    "end_minutes": end_minutes,
+                    "run_test_ids": [member["test_id"] for member in members]
+                })
     
-    return False
+    return slots + runs
+
+def slot_sort_key(slot, day_type, settings=None):
+    """Return a sort key for a matching slot; lower keys are better candidates.
+
+    Slots are ordered by preferred time window (earlier PREFERENCES entries
+    first, fully contained slots before partial overlaps), then by position in
+    PREFERRED_COURTS, then by how much of the allowed duration they cover.
+    """
+    settings = settings or get_venue_settings({})
+    windows = settings["preferences"].get(day_type, [])
+    preferred_courts = settings["preferred_courts"]
+    start_minutes = slot["start_minutes"]
+    end_minutes = slot["end_minutes"]
+    
+    window_rank = len(windows) * 2
+    for idx, (start_pref, end_pref) in enumerate(windows):
+        if start_pref <= start_minutes and end_minutes <= end_pref:
+            window_rank = idx * 2
+            break
+        if start_minutes < end_pref and end_minutes > start_pref:
+            window_rank = min(window_rank, idx * 2 + 1)
+    
+    court_rank = len(preferred_courts)
+    for idx, court in enumerate(preferred_courts):
+        if court.lower() == slot["court"].lower():
+            court_rank = idx
+            break
+    
+    # Longer slots are better, up to the longest booking allowed at their start time
+    duration_fit = min(end_minutes - start_minutes, max_duration_for(day_type, start_minutes, settings["max_duration"]))
+    
+    return (window_rank, court_rank, -duration_fit, start_minutes)
+
+def rank_slots(slots, day_type, settings=None):
+    """Return the slots (and coalesced runs) matching the day's preferences, best candidate first."""
+    index = get_preference_index(day_type, settings)
+    matches = []
+    for slot in coalesce_slots(slots, index.longest):
+        # Skip slots without valid time information
+        if slot["start_minutes"] is None or slot["end_minutes"] is None:
+            logger.error(f"Invalid time information for slot: {slot['time_text'] or slot['test_id']}")
+            continue
+        if index.matches(slot["start_minutes"], slot["end_minutes"]):
+            matches.append(slot)
+    
+    return sorted(matches, key=lambda slot: slot_sort_key(slot, day_type, settings))
 
 def minutes_to_time_str(minutes):
     """Convert minutes since midnight to a time string (HH:MM)."""
@@ -112,566 +313,885 @@ def minutes_to_time_str(minutes):
     mins = minutes % 60
     return f"{hours:02d}:{mins:02d}"
 
-def send_pushover_notification(slot_info):
-    """Send a Pushover notification with booking URL."""
-    if not all([PUSHOVER_USER_KEY, PUSHOVER_API_TOKEN]):
-        logger.error("Pushover configuration missing. Please set PUSHOVER_USER_KEY and PUSHOVER_API_TOKEN environment variables.")
-        return False
+# Walks the booking sheet once and returns plain records for every open slot,
+# so the Python side never needs a round trip per slot
+EXTRACT_SLOTS_JS = """() => {
+    const root = document.querySelector('.booking-sheet') || document;
+    const courtNames = {};
+    root.querySelectorAll('[data-resourceid] .resource-name, [data-id] .resource-name').forEach(el => {
+        const owner = el.closest('[data-resourceid], [data-id]');
+        const id = owner.getAttribute('data-resourceid') || owner.getAttribute('data-id');
+        if (id && !(id in courtNames)) {
+            courtNames[id] = el.textContent.trim();
+        }
+    });
+
+    return Array.from(root.querySelectorAll('.not-booked')).map((node, index) => {
+        const resourceId = node.getAttribute('data-resourceid');
+        const title = node.getAttribute('title');
+        const row = node.closest('.resource-row');
+        const rowName = row ? row.querySelector('.resource-name') : null;
+        const timeSpan = node.querySelector('.available-booking-slot');
+
+        let court = null;
+        if (rowName) {
+            court = rowName.textContent.trim();
+        } else if (resourceId && courtNames[resourceId]) {
+            court = courtNames[resourceId];
+        } else if (resourceId) {
+            court = 'Court ' + resourceId;
+        } else if (title && title.includes('Court')) {
+            court = title.split(' - ')[0].trim();
+        }
+
+        return {
+            index: index,
+            court: court,
+            resource_id: resourceId,
+            test_id: node.getAttribute('data-test-id'),
+            title: title,
+            time_text: timeSpan ? timeSpan.innerText : null,
+            inner_text: node.innerText
+        };
+    });
+}"""
+
+TIME_RANGE_PATTERN = re.compile(r"(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})")
+
+def parse_slot_times(record):
+    """Return (start_minutes, end_minutes) for a raw slot record, or (None, None)."""
+    # Prefer the "Book at 07:00 - 08:00" span text
+    time_match = TIME_RANGE_PATTERN.search(record.get("time_text") or "")
+    
+    if not time_match:
+        # data-test-id has the format booking-GUID|date|minutes
+        test_id = record.get("test_id")
+        if test_id:
+            parts = test_id.split("|")
+            if len(parts) >= 3 and parts[2].isdigit():
+                # Assume 1 hour slots by default
+                start_minutes = int(parts[2])
+                return start_minutes, start_minutes + 60
+            return None, None
+        # If all else fails, look for any time-like text in the slot
+        time_match = TIME_RANGE_PATTERN.search(record.get("inner_text") or "")
+    
+    if not time_match:
+        return None, None
+    
+    start_h, start_m, end_h, end_m = map(int, time_match.groups())
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+def parse_slot_record(record):
+    """Turn a raw record from EXTRACT_SLOTS_JS into a slot dict with start/end minutes."""
+    start_minutes, end_minutes = parse_slot_times(record)
+    return {
+        "index": record.get("index"),
+        "court": record.get("court") or "Unknown Court",
+        "resource_id": record.get("resource_id"),
+        "test_id": record.get("test_id"),
+        "title": record.get("title"),
+        "time_text": record.get("time_text"),
+        "start_minutes": start_minutes,
+        "end_minutes": end_minutes
+    }
+
+async def extract_slots(page):
+    """Extract all open slots from the booking sheet with a single page.evaluate call."""
+    with timed("extract"):
+        records = await page.evaluate(EXTRACT_SLOTS_JS)
+        return [parse_slot_record(record) for record in records]
+
+def slot_selector(slot):
+    """Return a CSS selector that locates the given slot record on the page."""
+    if slot.get("test_id"):
+        test_id = slot["test_id"].replace("\\", "\\\\").replace('"', '\\"')
+        return f'.not-booked[data-test-id="{test_id}"]'
+    return f".not-booked >> nth={slot['index']}"
+
+def parse_test_id(test_id):
+    """Split a data-test-id (booking-GUID|date|minutes) into (resource ID, date, start minutes)."""
+    parts = (test_id or "").split("|")
+    if len(parts) < 3 or not parts[0].startswith("booking-"):
+        return None, None, None
+    start = int(parts[2]) if parts[2].isdigit() else None
+    return parts[0][len("booking-"):] or None, parts[1] or None, start
+
+def booking_link_fields(slot):
+    """Return the metadata a booking link is built from for a candidate slot, or None if it lacks any.
+
+    The court's resource ID comes from data-resourceid (or the data-test-id GUID).
+    """
+    test_resource_id, test_date, test_start = parse_test_id(slot.get("test_id"))
+    fields = {
+        "venue": slot.get("venue"),
+        "resource_id": slot.get("resource_id") or test_resource_id,
+        "date": slot.get("date") or test_date,
+        "start": slot["start_minutes"] if slot["start_minutes"] is not None else test_start,
+        "end": slot["end_minutes"]
+    }
+    if any(value is None or value == "" for value in fields.values()):
+        return None
+    return fields
+
+def build_booking_link(slot):
+    """Return a link to the booking form of a candidate slot, built from its metadata, or None.
+
+    The link follows the booking form URL learned from the first captured
+    sign-in redirect (see booking_links); ClubSpark sends signed-out users
+    through sign-in and back to the form. Returns None until that URL is
+    known or when the slot lacks the metadata for a deep link.
+    """
+    fields = booking_link_fields(slot)
+    return booking_link_template.build(fields) if fields else None
+
+def slot_notification_info(slot):
+    """Basic notification details for a candidate slot, linking to its booking form if possible."""
+    return {
+        "date": slot["date"],
+        "venue_name": slot["venue_name"],
+        "court": slot["court"],
+        "start_time": minutes_to_time_str(slot["start_minutes"]),
+        "end_time": minutes_to_time_str(slot["end_minutes"]),
+        "booking_url": build_booking_link(slot) or slot["url"]
+    }
+
+def synthesized_notification_info(slot):
+    """Full notification details for the primary slot without clicking, or None if no link can be built."""
+    booking_link = build_booking_link(slot)
+    if not booking_link:
+        return None
+    
+    slot_info = slot_notification_info(slot)
+    slot_info["additional_message"] = (
+        f"To book this court:\n\n"
+        f"1. Log in to ClubSpark first at https://clubspark.lta.org.uk\n"
+        f"2. Click the booking link in this notification\n\n"
+        f"If the link does not open the booking form, find {slot['court']} at "
+        f"{slot_info['start_time']} on the day's sheet:\n{slot['url']}"
+    )
+    return slot_info
+
+async def load_booking_sheet(page, url):
+    """Navigate to the booking sheet and wait until its sessions are rendered, logging how long it took.
+
+    Raises if no session has rendered even after a grace period, since an
+    empty sheet would otherwise read as every slot taken.
+    """
+    start = time.perf_counter()
+    with timed("goto"):
+        await page.goto(url, wait_until=PAGE_WAIT_UNTIL)
     
     try:
-        # Prepare notification message
-        title = f"Tennis Court Available: {slot_info['date']} at {slot_info['start_time']}"
-        message = f"Tennis court available at London Fields Park!\n\nDate: {slot_info['date']}\nCourt: {slot_info['court']}\nTime: {slot_info['start_time']} - {slot_info['end_time']}"
+        # A rendered session cell is the readiness signal, not network idle
+        with timed("sheet_wait"):
+            await page.wait_for_selector(SHEET_READY_SELECTOR, timeout=30000)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"Booking calendar sessions loaded in {elapsed_ms:.0f}ms "
+            f"(wait_until={PAGE_WAIT_UNTIL}, block profile={BLOCK_PROFILE})"
+        )
+    except Exception as e:
+        logger.error(f"Error waiting for booking calendar: {str(e)}")
+        logger.info("Attempting to continue anyway...")
+        # Add a small delay to give the page more time to load
+        await page.wait_for_timeout(5000)
+        if await page.query_selector(SHEET_READY_SELECTOR) is None:
+            raise RuntimeError(f"Booking sheet at {url} rendered no sessions")
+
+async def find_candidates(page, venue, target_date):
+    """Load a venue's booking sheet for a date and return its matching slots, best first.
+
+    Only slots that opened since the previous run's grid are considered. Each
+    candidate carries its venue, date, a "rank" key that can be compared
+    across venues and dates, and the sheet's new "grid". The grid is saved
+    here when there are no candidates; otherwise the caller saves it once the
+    notification is delivered, so a failed attempt is retried on the next run.
+    """
+    date_str = format_date_for_url(target_date)
+    day_type = get_day_type(target_date)
+    
+    # Construct the URL for the target date
+    url = get_booking_url(venue["slug"], date_str)
+    logger.info(f"Checking availability at {venue['name']} for {date_str} (day type: {day_type})")
+    
+    # Record the sheet's data request so later runs can skip the browser
+    if AVAILABILITY_MODE == "http" and not availability_client.is_ready():
+        page.on("response", availability_client.capture)
+    
+    # Navigate to the page and wait for the booking calendar to load
+    await load_booking_sheet(page, url)
+    
+    # Extract every available slot in a single round trip
+    available_slots = await extract_slots(page)
+    SLOTS.inc(len(available_slots), stage="seen", source="browser")
+    
+    return select_candidates(available_slots, venue, target_date)
+
+def record_history(venue, date_str, slots):
+    """Add a sheet's open slots to the availability history; failures only cost the history."""
+    try:
+        with timed("history"):
+            history_store.record_scan(venue["slug"], date_str, slots)
+    except Exception as e:
+        logger.warning(f"Could not record availability history for {venue['name']} on {date_str}: {str(e)}")
+
+def evict_history():
+    """Drop old availability history; like recording, a failure only costs the history."""
+    try:
+        history_store.evict_expired()
+    except Exception as e:
+        logger.warning(f"Could not evict old availability history: {str(e)}")
+
+def select_candidates(available_slots, venue, target_date, source="browser"):
+    """Return the matching, newly opened slots of one sheet's open slots, best first.
+
+    The slots can come from the page or from the availability endpoint; see
+    find_candidates for the keys each candidate carries.
+    """
+    date_str = format_date_for_url(target_date)
+    day_type = get_day_type(target_date)
+    settings = get_venue_settings(venue)
+    url = get_booking_url(venue["slug"], date_str)
+    
+    # Diff against the previous run's grid so unchanged sheets need no matching
+    grid = AvailabilityGrid.from_slots(venue["slug"], date_str, available_slots)
+    record_history(venue, date_str, available_slots)
+    opened, taken = grid.diff(grid_store.load(venue["slug"], date_str))
+    if taken:
+        logger.info(f"{len(taken)} slots taken at {venue['name']} on {date_str} since the last run")
+    
+    if available_slots:
+        logger.info(f"Found {len(available_slots)} potentially available slots at {venue['name']} on {date_str}")
         
-        # Add additional message if provided
-        if 'additional_message' in slot_info and slot_info['additional_message']:
-            message += f"\n\n{slot_info['additional_message']}"
+        # Debug: print information about the first few slots
+        for idx, slot in enumerate(available_slots[:3]):
+            logger.debug(f"Slot {idx + 1} debug info: {slot}")
+    else:
+        logger.info(f"No available slots found at {venue['name']} for {date_str}")
+        grid_store.save(grid)
+        return []
+    
+    if not opened:
+        logger.info(f"No newly opened slots at {venue['name']} for {date_str}")
+        grid_store.save(grid)
+        return []
+    logger.info(f"{len(opened)} slots newly opened at {venue['name']} on {date_str}")
+    
+    # Only candidates that include a newly opened slot are worth notifying
+    candidates = [
+        slot for slot in rank_slots(available_slots, day_type, settings)
+        if touches(slot, opened)
+    ]
+    SLOTS.inc(len(candidates), stage="matched", source=source)
+    for slot in candidates:
+        slot["venue"] = venue["slug"]
+        slot["venue_name"] = venue["name"]
+        slot["date"] = date_str
+        slot["url"] = url
+        slot["rank"] = slot_sort_key(slot, day_type, settings) + (date_str,)
+        slot["grid"] = grid
+    
+    if not candidates:
+        logger.info(f"No slots matching preferences found at {venue['name']} for {date_str}")
+        grid_store.save(grid)
+    return candidates
+
+# Redirect statuses the booking flow may answer "Continue booking" with
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+def is_sign_in_redirect(url):
+    """Check whether a URL is a sign-in page carrying the booking as its return URL."""
+    lowered = url.lower()
+    return ('signin' in lowered or 'login' in lowered) and 'returnurl' in lowered
+
+async def capture_continue_redirect(page, continue_button, timeout=10000):
+    """Click "Continue booking" and return the URL it leads to, without loading the login page.
+
+    While the click is in flight the page's navigation requests are routed
+    and fetched without following redirects. The first sign-in redirect is
+    returned and its navigation aborted; other redirects are followed (the
+    first is kept as a fallback), and a page that is not a redirect ends the
+    attempt with its own URL. The route is removed again afterwards.
+    """
+    result = asyncio.get_running_loop().create_future()
+    fallback = []
+    
+    def resolve(url):
+        if not result.done():
+            result.set_result(url)
+    
+    async def intercept(route):
+        request = route.request
+        if result.done() or not request.is_navigation_request() or request.frame != page.main_frame:
+            await route.fallback()
+            return
         
-        # Handle long URLs (Pushover has limitations on URL length)
-        booking_url = slot_info['booking_url']
-        if len(booking_url) > 500:  # Pushover has limits on URL length
-            # Extract the essential parts of the URL
-            parts = booking_url.split("?")
-            base_url = parts[0]
-            # Just keep the base URL and note that it's truncated
-            logger.warning(f"URL too long ({len(booking_url)} chars), truncating for Pushover")
-            booking_url = f"{base_url}?...[truncated]"
-            # Add the full URL to the message body
-            message += f"\n\nFull URL (copy/paste):\n{slot_info['booking_url']}"
+        try:
+            response = await route.fetch(max_redirects=0)
+        except Exception as e:
+            if not result.done():
+                result.set_exception(e)
+            await route.abort()
+            return
         
-        # Prepare payload for Pushover API
-        payload = {
-            "token": PUSHOVER_API_TOKEN,
-            "user": PUSHOVER_USER_KEY,
-            "title": title,
-            "message": message,
-            "url": booking_url,
-            "url_title": "Book Now",
-            "priority": 1,  # High priority
-            "sound": "pushover"  # Distinct notification sound
+        location = response.headers.get("location")
+        if response.status in REDIRECT_STATUSES and location:
+            location = urljoin(request.url, location)
+            if is_sign_in_redirect(location):
+                logger.debug(f"Captured sign-in redirect URL: {location}")
+                resolve(location)
+                await route.abort()
+                return
+            if not fallback:
+                fallback.append(location)
+                logger.debug(f"Captured redirect URL: {location}")
+        else:
+            resolve(fallback[0] if fallback else request.url)
+        
+        # Hand the fetched response to the page, which follows it if it is a redirect
+        await route.fulfill(response=response)
+    
+    await page.route("**/*", intercept)
+    try:
+        await continue_button.click()
+        return await asyncio.wait_for(result, timeout / 1000)
+    finally:
+        await page.unroute("**/*", intercept)
+
+async def prepare_slot_notification(page, slot):
+    """Click through the booking flow for a candidate slot and build its notification details.
+
+    The page must show the candidate's booking sheet. Returns the slot info
+    for the notification, or None if no usable booking URL was found; the
+    page is left on the booking form.
+    """
+    date_str = slot["date"]
+    court_name = slot["court"]
+    start_minutes = slot["start_minutes"]
+    end_minutes = slot["end_minutes"]
+    start_time = minutes_to_time_str(start_minutes)
+    end_time = minutes_to_time_str(end_minutes)
+    
+    logger.info(f"Found matching slot: {court_name} on {date_str} at {start_time}-{end_time}")
+    
+    # Click on the slot to proceed to booking
+    await page.locator(slot_selector(slot)).first.click()
+    
+    # Wait for the booking details to load
+    try:
+        # Wait for the booking form or submit button
+        form_selector = "form, #submit-booking, #continueButton, button.primary[type='submit']"
+        await page.wait_for_selector(form_selector, timeout=10000)
+        logger.debug("Booking details page loaded successfully")
+        
+        # Get the current URL before clicking any buttons
+        initial_booking_url = page.url
+        logger.debug(f"Initial booking URL: {initial_booking_url}")
+        
+        # Check for the "Continue booking" button and click it if present
+        continue_button = await page.query_selector("#submit-booking, button.primary[type='submit']")
+        if continue_button:
+            logger.debug("Found 'Continue booking' button - preparing to click it")
+            
+            # Click the continue button; the sign-in redirect is captured without loading the login page
+            try:
+                with timed("navigation"):
+                    booking_url = await capture_continue_redirect(page, continue_button)
+                logger.debug(f"URL after clicking 'Continue booking': {booking_url}")
+                
+                # Check if this is a login page, which is what we want
+                is_login_page = "signin" in booking_url.lower() or "login" in booking_url.lower()
+                if is_login_page:
+                    logger.debug("Successfully captured the login URL with booking parameters")
+                    # Later slots' links are built from this one's booking form URL
+                    booking_link_template.learn(booking_url, booking_link_fields(slot))
+                else:
+                    logger.warning("Navigation did not lead to a login page; URL may not work for direct booking")
+                
+                # Create a more reliable direct URL to the venue's booking page
+                venue_name = slot["venue"]
+                
+                # Try to extract the date from URL or use our target date
+                date_match = re.search(r"Date=([^&]+)", booking_url)
+                booking_date = date_match.group(1) if date_match else date_str
+                
+                # Extract ResourceID for reference
+                resource_id_match = re.search(r"ResourceID=([^&]+)", booking_url)
+                resource_id_value = resource_id_match.group(1) if resource_id_match else "Unknown"
+                
+                # Create a simpler, more reliable booking page URL
+                direct_booking_url = get_booking_url(venue_name, booking_date)
+                logger.debug(f"Created direct booking page URL: {direct_booking_url}")
+                
+                # Send notification with both URLs
+                notification_info = {
+                    "date": date_str,
+                    "venue_name": slot["venue_name"],
+                    "court": court_name,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "booking_url": direct_booking_url  # Use the simpler, more reliable URL
+                }
+                
+                # Add detailed booking instructions to help the user navigate
+                notification_info["additional_message"] = (
+                    f"To book this court:\n\n"
+                    f"1. Log in to ClubSpark first at https://clubspark.lta.org.uk\n"
+                    f"2. Click the booking link in this notification\n"
+                    f"3. Find and select {court_name} at {start_time} on {date_str}\n\n"
+                    f"Court ID: {resource_id_value}\n"
+                    f"Venue: {venue_name}\n"
+                    f"Time: {start_time} - {end_time}"
+                )
+                
+                return notification_info
+                
+            except Exception as nav_error:
+                logger.error(f"Error during navigation after clicking continue: {str(nav_error)}")
+                # Fall back to the initial URL
+                booking_url = initial_booking_url
+        else:
+            logger.warning("No 'Continue booking' button found")
+            redirect_booking_url = initial_booking_url
+        
+        # Extract relevant details from the URL or page content
+        # Look for resource ID and other booking parameters
+        resource_id = None
+        date_param = None
+        
+        try:
+            # Try to find these values in the URL or in hidden form fields
+            resource_id_element = await page.query_selector("[name='ResourceID']")
+            resource_id = slot["resource_id"]
+            if not resource_id and resource_id_element:
+                resource_id = await resource_id_element.get_attribute("value")
+            
+            # Extract data from data-test-id (format: booking-GUID|date|time)
+            test_id = slot["test_id"]
+            if test_id:
+                parts = test_id.split("|")
+                if len(parts) >= 2:
+                    booking_id = parts[0].replace("booking-", "")
+                    date_param = parts[1]
+        except Exception as e:
+            logger.warning(f"Error extracting booking parameters: {str(e)}")
+        
+        # Log the extracted parameters
+        if resource_id:
+            logger.debug(f"Resource ID: {resource_id}")
+        if date_param:
+            logger.debug(f"Date parameter: {date_param}")
+        
+        # Create a direct booking URL if possible with the extracted parameters
+        venue_part = slot["venue"]
+        
+        # Try to extract ResourceID, Date, and other parameters from the booking URL
+        resource_id_param = None
+        date_param = None
+        
+        # First try to get from the redirect URL which should contain these parameters
+        param_extract = re.search(r"ResourceID=([^&]+).*?Date=([^&]+)", redirect_booking_url)
+        if param_extract:
+            resource_id_param = param_extract.group(1)
+            date_param = param_extract.group(2)
+            logger.debug(f"Extracted ResourceID={resource_id_param} and Date={date_param} from booking URL")
+        
+        # If we didn't get the params from URL, try data attributes
+        if not resource_id_param:
+            resource_id_param = resource_id or slot["resource_id"]
+            
+            # Try extracting from data-test-id if not found yet
+            if not date_param:
+                test_id = slot["test_id"]
+                if test_id:
+                    parts = test_id.split("|")
+                    if len(parts) >= 2:
+                        date_param = parts[1]
+        
+        # Create a simplified direct URL that works more reliably
+        simplified_url = None
+        if venue_part:
+            if resource_id_param and date_param:
+                # Create a direct link to the court on the specific date
+                simplified_url = get_booking_url(venue_part, date_param)
+                logger.debug(f"Created simplified booking URL: {simplified_url}")
+            else:
+                # Just link to the venue booking page for the date
+                simplified_url = get_booking_url(venue_part, date_str)
+                logger.debug(f"Created fallback venue booking URL: {simplified_url}")
+        
+        # Send notification with the most reliable URL option
+        booking_url_to_use = simplified_url if simplified_url else redirect_booking_url
+        slot_info = {
+            "date": date_str,
+            "venue_name": slot["venue_name"],
+            "court": court_name,
+            "start_time": start_time,
+            "end_time": end_time,
+            "booking_url": booking_url_to_use
         }
         
-        # For testing or debugging, print the payload length but mask sensitive data
-        debug_payload = payload.copy()
-        debug_payload["token"] = "***masked***"
-        debug_payload["user"] = "***masked***"
-        logger.debug(f"Pushover payload length: {len(str(payload))} bytes")
+        # Log the final booking URL we're using for the notification
+        logger.debug(f"Final booking URL for notification: {booking_url_to_use}")
         
-        # Send the notification
-        response = requests.post(PUSHOVER_API_URL, data=payload)
-        response.raise_for_status()  # Raise exception for HTTP errors
+        # Add booking instructions with more detail
+        slot_info["additional_message"] = (
+            f"To book this court:\n"
+            f"1. Log in to ClubSpark first at https://clubspark.lta.org.uk\n"
+            f"2. Then click the booking link\n"
+            f"3. Find {court_name} court at {start_time} on {date_str}\n\n"
+            f"If you get an error, try going directly to:\n"
+            f"{get_booking_url(venue_part, date_str)}"
+        )
+        
+        return slot_info
         
-        logger.info(f"Pushover notification sent for slot on {slot_info['date']} at {slot_info['start_time']}")
-        return True
-    
     except Exception as e:
-        logger.error(f"Failed to send Pushover notification: {str(e)}")
-        # For common errors, give more specific advice
-        if "400" in str(e):
-            logger.error("HTTP 400 Error: This could be due to invalid API credentials or message format")
-        elif "413" in str(e) or "too large" in str(e).lower():
-            logger.error("Message too large: Try shortening the URL or message")
-        return False
-
-def check_court_availability():
-    """Main function to check for available tennis courts."""
-    logger.info("Starting court availability check")
-    
-    with sync_playwright() as p:
+        logger.error(f"Error processing booking details: {str(e)}")
+        # If we couldn't process the booking details, try to get the current URL anyway
         try:
-            # Launch browser with additional arguments for cloud environment
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-accelerated-2d-canvas',
-                    '--no-first-run',
-                    '--no-zygote',
-                    '--single-process',
-                    '--disable-gpu'
-                ]
-            )
-            context = browser.new_context(viewport={"width": 1920, "height": 1080})
-            page = context.new_page()
+            booking_url = page.url
+            logger.debug(f"Fallback to current URL: {booking_url}")
             
-            # Get the target date (6 days from now)
-            target_date = get_target_date()
-            date_str = format_date_for_url(target_date)
-            day_type = get_day_type(target_date)
+            # Send notification with the current URL as fallback
+            slot_info = {
+                "date": date_str,
+                "venue_name": slot["venue_name"],
+                "court": court_name,
+                "start_time": start_time,
+                "end_time": end_time,
+                "booking_url": booking_url,
+                "additional_message": "Please log in to ClubSpark first before using this link."
+            }
             
-            # Construct the URL for the target date
-            url = f"{BASE_URL}#?date={date_str}"
-            logger.info(f"Checking availability for {date_str} (day type: {day_type})")
+            return slot_info
+        except Exception as inner_e:
+            logger.error(f"Error with fallback notification: {str(inner_e)}")
+    
+    return None
+
+# Buttons that move the booking form on, the page shown once a booking is made,
+# and a card payment step, which is left to the user
+BOOKING_STEP_SELECTOR = "#submit-booking, #continueButton, #confirm-booking, button.primary[type='submit']"
+BOOKING_CONFIRMED_SELECTOR = ".booking-confirmation, .confirmation, [data-test-id='booking-confirmation']"
+PAYMENT_SELECTOR = "iframe[src*='stripe'], input[name='cardnumber']"
+
+# Form pages stepped through before auto-booking gives up
+MAX_BOOKING_STEPS = 4
+
+async def book_slot(context, slot, mode="check"):
+    """Take a candidate slot through the booking form to confirmation on a signed-in context.
+
+    Opens the slot's booking form (from its built link, or by clicking it on
+    the sheet) and presses the form's continue/confirm button until the
+    confirmation page shows, for at most MAX_BOOKING_STEPS pages. Returns
+    "booked", "payment_required" when the form stops at a card payment,
+    "signed_out" when ClubSpark asks to sign in, or "failed".
+    """
+    start_time = minutes_to_time_str(slot["start_minutes"])
+    page = await context.new_page()
+    try:
+        with timed("auto_book"):
+            booking_link = build_booking_link(slot)
+            if booking_link:
+                await page.goto(booking_link, wait_until=PAGE_WAIT_UNTIL)
+            else:
+                await load_booking_sheet(page, slot["url"])
+                await page.locator(slot_selector(slot)).first.click()
             
-            # Navigate to the page and wait for it to be fully loaded
-            page.goto(url, wait_until="networkidle")
+            for step in range(MAX_BOOKING_STEPS):
+                await page.wait_for_selector(
+                    f"{BOOKING_CONFIRMED_SELECTOR}, {PAYMENT_SELECTOR}, {BOOKING_STEP_SELECTOR}", timeout=15000
+                )
+                if is_sign_in_redirect(page.url):
+                    logger.warning("Auto-booking was sent to sign in, the saved ClubSpark session is not valid")
+                    return "signed_out"
+                if await page.query_selector(BOOKING_CONFIRMED_SELECTOR):
+                    logger.info(f"Booked {slot['court']} on {slot['date']} at {start_time} in {step} steps")
+                    await screenshots.capture(page, f"booking_confirmed_{slot['date']}_{start_time.replace(':', '')}", mode)
+                    return "booked"
+                if await page.query_selector(PAYMENT_SELECTOR):
+                    logger.info(f"Booking of {slot['court']} on {slot['date']} at {start_time} needs a card payment")
+                    return "payment_required"
+                
+                button = await page.query_selector(BOOKING_STEP_SELECTOR)
+                logger.debug(f"Auto-booking step {step + 1}: submitting {page.url}")
+                async with page.expect_navigation(wait_until=PAGE_WAIT_UNTIL, timeout=15000):
+                    await button.click()
             
-            # Wait for the booking calendar to load
+            logger.warning(f"No booking confirmation after {MAX_BOOKING_STEPS} steps, last page {page.url}")
+            return "failed"
+    except Exception as e:
+        logger.error(f"Error auto-booking {slot['court']} on {slot['date']} at {start_time}: {str(e)}")
+        return "failed"
+    finally:
+        await page.close()
+
+def apply_booking_outcome(slot_info, outcome):
+    """Adjust a slot's notification details to say whether auto-booking made the booking."""
+    if outcome == "booked":
+        slot_info["booked"] = True
+        slot_info["additional_message"] = (
+            "Booked automatically with the saved ClubSpark account; "
+            "it is listed under your bookings on ClubSpark."
+        )
+    elif outcome == "payment_required":
+        slot_info["additional_message"] = (
+            "Auto-booking reached the payment step; open the link to pay and finish the booking.\n\n"
+            + slot_info.get("additional_message", "")
+        ).strip()
+    else:
+        slot_info["additional_message"] = (
+            f"Auto-booking did not complete ({outcome}), book it yourself.\n\n"
+            + slot_info.get("additional_message", "")
+        ).strip()
+    return slot_info
+
+async def book_and_report(context, slot, mode="check"):
+    """Auto-book a slot whose notification is already queued, then notify the outcome."""
+    if not auth_session.storage_state():
+        logger.warning("AUTO_BOOK is on but there is no saved ClubSpark session, only notifying")
+        return None
+    
+    with log_context(venue=slot["venue"], date=slot["date"]):
+        outcome = await book_slot(context, slot, mode)
+    if outcome == "booked":
+        SLOTS.inc(stage="booked", source="browser")
+    notifier.notify([apply_booking_outcome(slot_notification_info(slot), outcome)])
+    return outcome
+
+def booking_storage_state():
+    """Saved session to start a run's browser context with; only auto-booking needs to be signed in."""
+    return auth_session.storage_state() if AUTO_BOOK else None
+
+def candidates_over_http(venue, target_date):
+    """Read a venue's target date over plain HTTP and return its candidates, best first.
+
+    The records go through select_candidates like a scanned sheet's. Returns
+    None when the browser has to scan the sheet instead (endpoint unknown,
+    request failed, unexpected JSON).
+    """
+    if not availability_client.is_ready():
+        logger.info("Availability endpoint not discovered yet, using the browser")
+        return None
+    
+    date_str = format_date_for_url(target_date)
+    try:
+        with timed("http_fetch"):
+            slots = availability_client.fetch_slots(date_str, venue["slug"])
+    except AvailabilityShapeError as e:
+        logger.warning(f"Availability endpoint changed shape ({str(e)}), falling back to the browser")
+        availability_client.reset()
+        return None
+    except requests.RequestException as e:
+        logger.warning(f"HTTP availability check failed ({str(e)}), falling back to the browser")
+        return None
+    
+    SLOTS.inc(len(slots), stage="seen", source="http")
+    return select_candidates(slots, venue, target_date, source="http")
+
+def needs_browser(candidates):
+    """Check whether notifying the candidates needs a page: to auto-book, or to click through a slot."""
+    if not candidates:
+        return False
+    if AUTO_BOOK or BOOKING_LINKS != "synthesize":
+        return True
+    return any(build_booking_link(slot) is None for slot in candidates)
+
+async def scan_sheets(context, sheets, found=None):
+    """Scan (venue, date) sheets concurrently, then notify the best candidate overall.
+
+    found optionally lists candidates already read over HTTP, which are
+    ranked together with the scanned ones. At most SCAN_CONCURRENCY sheets load at once. Only the page holding the
+    best candidate found so far is kept open, so the top-ranked slot can be
+    clicked without reloading its sheet; next-best candidates are tried (on
+    a freshly loaded sheet) only if that fails. The other matches are listed
+    in the same digest notification, which is queued on the notifier and
+    not waited for. Returns True if a notification was queued; raises if
+    no sheet could be scanned at all.
+    """
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    candidates = list(found or [])
+    failures = []
+    held = {"best": None, "page": None}
+    
+    async def scan(venue, target_date):
+        async with semaphore:
+            page = await context.new_page()
             try:
-                # Wait for the booking-sheet class which is the correct one for this calendar view
-                page.wait_for_selector(".booking-sheet", timeout=30000)
-                logger.info("Booking calendar (.booking-sheet) loaded successfully")
+                with log_context(venue=venue["slug"], date=format_date_for_url(target_date)):
+                    sheet_candidates = await find_candidates(page, venue, target_date)
             except Exception as e:
-                logger.error(f"Error waiting for booking calendar: {str(e)}")
-                logger.info("Attempting to continue anyway...")
-                # Add a small delay to give the page more time to load
-                page.wait_for_timeout(5000)
+                logger.error(f"Error checking {venue['name']} on {format_date_for_url(target_date)}: {str(e)}")
+                failures.append(e)
+                sheet_candidates = []
+            candidates.extend(sheet_candidates)
             
-            # Find all available slots with the class 'not-booked'
-            available_slots = page.query_selector_all(".not-booked")
-            
-            # Get information about available slots for debugging
-            if available_slots:
-                logger.info(f"Found {len(available_slots)} potentially available slots")
-                
-                # Debug: print information about the first few slots
-                for idx, slot in enumerate(available_slots[:3]):  # Look at just the first 3 slots
-                    try:
-                        # Get attributes and properties
-                        attributes = slot.evaluate("""node => {
-                            const attrs = {};
-                            for (let i = 0; i < node.attributes.length; i++) {
-                                const attr = node.attributes[i];
-                                attrs[attr.name] = attr.value;
-                            }
-                            
-                            // Also get class list
-                            attrs['classList'] = Array.from(node.classList);
-                            
-                            // Get inner text
-                            attrs['innerText'] = node.innerText;
-                            
-                            // Get parent element info
-                            if (node.parentElement) {
-                                attrs['parentClasses'] = Array.from(node.parentElement.classList);
-                            }
-                            
-                            return attrs;
-                        }""")
-                        
-                        logger.info(f"Slot {idx + 1} debug info:")
-                        for key, value in attributes.items():
-                            logger.info(f"  {key}: {value}")
-                    except Exception as e:
-                        logger.error(f"Error getting debug info for slot {idx + 1}: {str(e)}")
+            # Keep this page loaded only if it holds the best candidate so far
+            to_close = page
+            if sheet_candidates and (held["best"] is None or sheet_candidates[0]["rank"] < held["best"]["rank"]):
+                to_close = held["page"]
+                held["best"], held["page"] = sheet_candidates[0], page
+            if to_close is not None:
+                await to_close.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(scan(venue, target_date) for venue, target_date in sheets))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info(f"Scanned {len(sheets)} booking sheets in {elapsed_ms:.0f}ms, {len(candidates)} matching slots in total")
+    if sheets and len(failures) == len(sheets):
+        raise RuntimeError(f"All {len(sheets)} booking sheets failed, last error: {str(failures[-1])}")
+    
+    return await notify_best(context, candidates, held)
+
+async def notify_best(context, candidates, held=None, mode="check"):
+    """Queue one digest notification for the new candidates, led by the best one.
+
+    The best candidate's booking link is built from its metadata (see
+    BOOKING_LINKS); if that is not possible it is clicked through, moving on
+    to the next-best candidate on failure. held optionally maps
+    {"best": slot, "page": page} for a page already showing that slot's
+    sheet; other click-throughs load their sheet first. context may be None
+    when needs_browser() is False for the candidates. mode selects whether
+    screenshots are taken (see SCREENSHOT_MODES). With AUTO_BOOK the notified candidate is then
+    booked through to confirmation on the (signed-in) context and a follow-up
+    notification reports the outcome. Returns True if a notification was
+    queued.
+    """
+    held = held or {"best": None, "page": None}
+    if not candidates:
+        return False
+    
+    # Merge and rank every venue's candidates together before notifying
+    candidates.sort(key=lambda slot: slot["rank"])
+    grids = list({id(slot["grid"]): slot["grid"] for slot in candidates}.values())
+    
+    # Skip slots an earlier run already notified before clicking into anything
+    new_candidates = notified_store.filter_new(candidates)
+    if len(new_candidates) < len(candidates):
+        logger.info(f"Skipping {len(candidates) - len(new_candidates)} already notified slots")
+    candidates = new_candidates
+    if not candidates:
+        for grid in grids:
+            grid_store.save(grid)
+        return False
+    
+    for slot in candidates:
+        page = held["page"] if slot is held["best"] else None
+        clicked = False
+        try:
+            # Build the booking link from the slot's metadata; click through only if that is not possible
+            slot_info = synthesized_notification_info(slot) if BOOKING_LINKS == "synthesize" else None
+            if slot_info:
+                logger.info(f"Built booking link for {slot['court']} on {slot['date']} at {slot_info['start_time']} without clicking")
             else:
-                logger.info(f"No available slots found for {date_str}")
-                return
-            
-            # Process each available slot
-            for slot in available_slots:
-                try:
-                    # Try different methods to get court name
-                    court_name = "Unknown Court"
-                    
-                    try:
-                        # Method 1: Try to get the court name from any parent element with a court name
-                        parent_row = slot.evaluate("node => node.closest('.resource-row')")
-                        if parent_row:
-                            court_name_el = page.evaluate("el => el.querySelector('.resource-name')", parent_row)
-                            if court_name_el:
-                                court_name = page.evaluate("el => el.textContent.trim()", court_name_el)
-                    except Exception as e:
-                        logger.warning(f"Method 1 failed to get court name: {str(e)}")
-                        
-                        try:
-                            # Method 2: Try using data attributes on the slot
-                            resource_id = slot.get_attribute("data-resourceid")
-                            if resource_id:
-                                # Look for elements with the same resource ID
-                                resource_name_el = page.query_selector(f"[data-resourceid='{resource_id}'] .resource-name, [data-id='{resource_id}'] .resource-name")
-                                if resource_name_el:
-                                    court_name = resource_name_el.inner_text().strip()
-                                else:
-                                    # Just use the resource ID as a fallback
-                                    court_name = f"Court {resource_id}"
-                        except Exception as inner_e:
-                            logger.warning(f"Method 2 failed to get court name: {str(inner_e)}")
-                            
-                            try:
-                                # Method 3: Check if the slot has a title attribute with court info
-                                title = slot.get_attribute("title")
-                                if title and "Court" in title:
-                                    court_name = title.split(" - ")[0].strip()
-                            except Exception as inner_e2:
-                                logger.warning(f"Method 3 failed to get court name: {str(inner_e2)}")
-                    
-                    # Get time information from attributes or alternative sources
-                    try:
-                        # Look for the 'available-booking-slot' span which contains the time information
-                        time_span = slot.query_selector(".available-booking-slot")
-                        if time_span:
-                            time_text = time_span.inner_text()
-                            logger.info(f"Found time text: {time_text}")
-                            
-                            # Extract time information from text like "Book at 07:00 - 08:00"
-                            time_pattern = r"(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})"
-                            time_match = re.search(time_pattern, time_text)
-                            
-                            if time_match:
-                                start_time_str, end_time_str = time_match.groups()
-                                
-                                # Convert time strings to minutes
-                                start_h, start_m = map(int, start_time_str.split(":"))
-                                end_h, end_m = map(int, end_time_str.split(":"))
-                                
-                                start_minutes = start_h * 60 + start_m
-                                end_minutes = end_h * 60 + end_m
-                                
-                                logger.info(f"Extracted time: {start_time_str} to {end_time_str}")
-                            else:
-                                # Try extracting from data-test-id which contains court|date|time
-                                test_id = slot.get_attribute("data-test-id")
-                                if test_id:
-                                    parts = test_id.split("|")
-                                    if len(parts) >= 3:
-                                        # The third part is time in minutes from midnight
-                                        try:
-                                            start_minutes = int(parts[2])
-                                            # Assume 1 hour slots by default
-                                            end_minutes = start_minutes + 60
-                                            logger.info(f"Extracted time from data-test-id: {start_minutes} minutes (slot duration: 60 min)")
-                                        except ValueError:
-                                            raise ValueError(f"Could not convert time value from data-test-id: {parts[2]}")
-                                    else:
-                                        raise ValueError(f"data-test-id does not contain expected format: {test_id}")
-                                else:
-                                    raise ValueError("No available-booking-slot span or data-test-id found")
-                        else:
-                            # Try extracting from data-test-id which contains court|date|time
-                            test_id = slot.get_attribute("data-test-id")
-                            if test_id:
-                                parts = test_id.split("|")
-                                if len(parts) >= 3:
-                                    # The third part is time in minutes from midnight
-                                    try:
-                                        start_minutes = int(parts[2])
-                                        # Assume 1 hour slots by default
-                                        end_minutes = start_minutes + 60
-                                        logger.info(f"Extracted time from data-test-id: {start_minutes} minutes (slot duration: 60 min)")
-                                    except ValueError:
-                                        raise ValueError(f"Could not convert time value from data-test-id: {parts[2]}")
-                                else:
-                                    raise ValueError(f"data-test-id does not contain expected format: {test_id}")
-                            else:
-                                # If all else fails, try to find any time-like text in the slot
-                                inner_text = slot.inner_text()
-                                time_pattern = r"(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})"
-                                time_match = re.search(time_pattern, inner_text)
-                                
-                                if time_match:
-                                    start_time_str, end_time_str = time_match.groups()
-                                    
-                                    # Convert time strings to minutes
-                                    start_h, start_m = map(int, start_time_str.split(":"))
-                                    end_h, end_m = map(int, end_time_str.split(":"))
-                                    
-                                    start_minutes = start_h * 60 + start_m
-                                    end_minutes = end_h * 60 + end_m
-                                    
-                                    logger.info(f"Extracted time from inner text: {start_time_str} to {end_time_str}")
-                                else:
-                                    raise ValueError("Could not find time information in the slot")
-                    except Exception as e:
-                        logger.error(f"Error getting time information: {str(e)}")
-                        # Skip this slot if we can't determine time
-                        continue
-                    
-                    # Skip if we still don't have valid time information
-                    if start_minutes is None or end_minutes is None:
-                        logger.error("Invalid time information for slot")
-                        continue
-                    
-                    # Check if the slot matches preferences
-                    if is_time_in_preferences(day_type, start_minutes, end_minutes):
-                        start_time = minutes_to_time_str(start_minutes)
-                        end_time = minutes_to_time_str(end_minutes)
-                        
-                        logger.info(f"Found matching slot: {court_name} on {date_str} at {start_time}-{end_time}")
-                        
-                        # Click on the slot to proceed to booking
-                        slot.click()
-                        
-                        # Wait for the booking details to load
-                        try:
-                            # Wait for the booking form or submit button
-                            form_selector = "form, #submit-booking, #continueButton, button.primary[type='submit']"
-                            page.wait_for_selector(form_selector, timeout=10000)
-                            logger.info("Booking details page loaded successfully")
-                            
-                            # Take a screenshot of the booking page
-                            screenshot_path = f"booking_page_{date_str}_{start_time.replace(':', '')}.png"
-                            page.screenshot(path=screenshot_path)
-                            logger.info(f"Saved screenshot of booking page to {screenshot_path}")
-                            
-                            # Get the current URL before clicking any buttons
-                            initial_booking_url = page.url
-                            logger.info(f"Initial booking URL: {initial_booking_url}")
-                            
-                            # Check for the "Continue booking" button and click it if present
-                            continue_button = page.query_selector("#submit-booking, button.primary[type='submit']")
-                            if continue_button:
-                                logger.info("Found 'Continue booking' button - preparing to click it")
-                                
-                                # Set up a navigation listener to capture the redirect URL
-                                redirect_url = [None]  # Use a list to store the URL so it can be modified in the closure
-                                
-                                def handle_response(response):
-                                    if response.status == 302 or response.status == 301:
-                                        location = response.headers.get("location")
-                                        if location:
-                                            # Make the location URL absolute if it's relative
-                                            if location.startswith('/'):
-                                                base_url = response.url.split('/', 3)[:3]
-                                                base_url = '/'.join(base_url)
-                                                location = f"{base_url}{location}"
-                                            
-                                            # Check if this appears to be a sign-in URL with booking parameters
-                                            if ('signin' in location.lower() or 'login' in location.lower()) and 'returnurl' in location.lower():
-                                                redirect_url[0] = location
-                                                logger.info(f"Captured sign-in redirect URL: {location}")
-                                            else:
-                                                # Store any redirect URL as a fallback
-                                                if not redirect_url[0]:
-                                                    redirect_url[0] = location
-                                                    logger.info(f"Captured redirect URL: {location}")
-                                
-                                # Listen for responses
-                                page.on("response", handle_response)
-                                
-                                # Click the continue button and wait for navigation
-                                try:
-                                    with page.expect_navigation(timeout=10000) as navigation_info:
-                                        continue_button.click()
-                                    
-                                    # Get the final URL after navigation
-                                    final_url = page.url
-                                    logger.info(f"Final URL after clicking 'Continue booking': {final_url}")
-                                    
-                                    # Save screenshot of the landing page
-                                    page.screenshot(path=f"post_continue_page_{date_str}_{start_time.replace(':', '')}.png")
-                                    
-                                    # Use the redirect URL if available, otherwise use the final URL
-                                    booking_url = redirect_url[0] if redirect_url[0] else final_url
-                                    
-                                    # Check if this is a login page, which is what we want
-                                    is_login_page = "signin" in booking_url.lower() or "login" in booking_url.lower()
-                                    if is_login_page:
-                                        logger.info("Successfully captured the login URL with booking parameters")
-                                    else:
-                                        logger.warning("Navigation did not lead to a login page; URL may not work for direct booking")
-                                    
-                                    # Create a more reliable direct URL to the venue's booking page
-                                    venue_name = None
-                                    
-                                    # Try to determine the venue
-                                    if "ClissoldParkHackney" in booking_url:
-                                        venue_name = "ClissoldParkHackney"
-                                    elif "LondonFieldsPark" in booking_url:
-                                        venue_name = "LondonFieldsPark"
-                                    else:
-                                        # Try to extract venue from URL
-                                        venue_match = re.search(r"//[^/]+/([^/]+)/", booking_url)
-                                        venue_name = venue_match.group(1) if venue_match else "ClissoldParkHackney"
-                                    
-                                    # Try to extract the date from URL or use our target date
-                                    date_match = re.search(r"Date=([^&]+)", booking_url)
-                                    booking_date = date_match.group(1) if date_match else date_str
-                                    
-                                    # Extract ResourceID for reference
-                                    resource_id_match = re.search(r"ResourceID=([^&]+)", booking_url)
-                                    resource_id_value = resource_id_match.group(1) if resource_id_match else "Unknown"
-                                    
-                                    # Create a simpler, more reliable booking page URL
-                                    direct_booking_url = f"https://clubspark.lta.org.uk/{venue_name}/Booking/BookByDate#?date={booking_date}"
-                                    logger.info(f"Created direct booking page URL: {direct_booking_url}")
-                                    
-                                    # Send notification with both URLs
-                                    notification_info = {
-                                        "date": date_str,
-                                        "court": court_name,
-                                        "start_time": start_time,
-                                        "end_time": end_time,
-                                        "booking_url": direct_booking_url  # Use the simpler, more reliable URL
-                                    }
-                                    
-                                    # Add detailed booking instructions to help the user navigate
-                                    notification_info["additional_message"] = (
-                                        f"To book this court:\n\n"
-                                        f"1. Log in to ClubSpark first at https://clubspark.lta.org.uk\n"
-                                        f"2. Click the booking link in this notification\n"
-                                        f"3. Find and select {court_name} at {start_time} on {date_str}\n\n"
-                                        f"Court ID: {resource_id_value}\n"
-                                        f"Venue: {venue_name}\n"
-                                        f"Time: {start_time} - {end_time}"
-                                    )
-                                    
-                                    notification_sent = send_pushover_notification(notification_info)
-                                    if notification_sent:
-                                        logger.info("Notification sent successfully. Stopping search as we found a matching slot.")
-                                        # Stop processing more slots after finding a match and sending notification
-                                        return
-                                    
-                                except Exception as nav_error:
-                                    logger.error(f"Error during navigation after clicking continue: {str(nav_error)}")
-                                    # Fall back to the initial URL
-                                    booking_url = initial_booking_url
-                            else:
-                                logger.warning("No 'Continue booking' button found")
-                                redirect_booking_url = initial_booking_url
-                            
-                            # Extract relevant details from the URL or page content
-                            # Look for resource ID and other booking parameters
-                            resource_id = None
-                            date_param = None
-                            
-                            try:
-                                # Try to find these values in the URL or in hidden form fields
-                                resource_id_element = page.query_selector("[name='ResourceID']")
-                                resource_id = slot.get_attribute("data-resourceid")
-                                if not resource_id and resource_id_element:
-                                    resource_id = resource_id_element.get_attribute("value")
-                                
-                                # Extract data from data-test-id (format: booking-GUID|date|time)
-                                test_id = slot.get_attribute("data-test-id")
-                                if test_id:
-                                    parts = test_id.split("|")
-                                    if len(parts) >= 2:
-                                        booking_id = parts[0].replace("booking-", "")
-                                        date_param = parts[1]
-                            except Exception as e:
-                                logger.warning(f"Error extracting booking parameters: {str(e)}")
-                            
-                            # Log the extracted parameters
-                            if resource_id:
-                                logger.info(f"Resource ID: {resource_id}")
-                            if date_param:
-                                logger.info(f"Date parameter: {date_param}")
-                            
-                            # Create a direct booking URL if possible with the extracted parameters
-                            direct_url = None
-                            if "ClissoldParkHackney" in redirect_booking_url:
-                                venue_part = "ClissoldParkHackney"
-                            elif "LondonFieldsPark" in redirect_booking_url:
-                                venue_part = "LondonFieldsPark"
-                            else:
-                                # Extract venue name from URL
-                                venue_match = re.search(r"//[^/]+/([^/]+)/Booking", redirect_booking_url)
-                                venue_part = venue_match.group(1) if venue_match else None
-                            
-                            # Try to extract ResourceID, Date, and other parameters from the booking URL
-                            resource_id_param = None
-                            date_param = None
-                            
-                            # First try to get from the redirect URL which should contain these parameters
-                            param_extract = re.search(r"ResourceID=([^&]+).*?Date=([^&]+)", redirect_booking_url)
-                            if param_extract:
-                                resource_id_param = param_extract.group(1)
-                                date_param = param_extract.group(2)
-                                logger.info(f"Extracted ResourceID={resource_id_param} and Date={date_param} from booking URL")
-                            
-                            # If we didn't get the params from URL, try data attributes
-                            if not resource_id_param:
-                                resource_id_param = resource_id or slot.get_attribute("data-resourceid")
-                                
-                                # Try extracting from data-test-id if not found yet
-                                if not date_param:
-                                    test_id = slot.get_attribute("data-test-id")
-                                    if test_id:
-                                        parts = test_id.split("|")
-                                        if len(parts) >= 2:
-                                            date_param = parts[1]
-                            
-                            # Create a simplified direct URL that works more reliably
-                            simplified_url = None
-                            if venue_part:
-                                if resource_id_param and date_param:
-                                    # Create a direct link to the court on the specific date
-                                    simplified_url = f"https://clubspark.lta.org.uk/{venue_part}/Booking/BookByDate#?date={date_param}"
-                                    logger.info(f"Created simplified booking URL: {simplified_url}")
-                                else:
-                                    # Just link to the venue booking page for the date
-                                    simplified_url = f"https://clubspark.lta.org.uk/{venue_part}/Booking/BookByDate#?date={date_str}"
-                                    logger.info(f"Created fallback venue booking URL: {simplified_url}")
-                            
-                            # Send notification with the most reliable URL option
-                            booking_url_to_use = simplified_url if simplified_url else redirect_booking_url
-                            slot_info = {
-                                "date": date_str,
-                                "court": court_name,
-                                "start_time": start_time,
-                                "end_time": end_time,
-                                "booking_url": booking_url_to_use
-                            }
-                            
-                            # Log the final booking URL we're using for the notification
-                            logger.info(f"Final booking URL for notification: {booking_url_to_use}")
-                            
-                            # Add booking instructions with more detail
-                            slot_info["additional_message"] = (
-                                f"To book this court:\n"
-                                f"1. Log in to ClubSpark first at https://clubspark.lta.org.uk\n"
-                                f"2. Then click the booking link\n"
-                                f"3. Find {court_name} court at {start_time} on {date_str}\n\n"
-                                f"If you get an error, try going directly to:\n"
-                                f"https://clubspark.lta.org.uk/{venue_part or 'ClissoldParkHackney'}/Booking/BookByDate#?date={date_str}"
-                            )
-                            
-                            notification_sent = send_pushover_notification(slot_info)
-                            if notification_sent:
-                                logger.info("Notification sent successfully. Stopping search as we found a matching slot.")
-                                # Stop processing more slots after finding a match and sending notification
-                                return
-                            
-                        except Exception as e:
-                            logger.error(f"Error processing booking details: {str(e)}")
-                            # If we couldn't process the booking details, try to get the current URL anyway
-                            try:
-                                booking_url = page.url
-                                logger.info(f"Fallback to current URL: {booking_url}")
-                                
-                                # Send notification with the current URL as fallback
-                                slot_info = {
-                                    "date": date_str,
-                                    "court": court_name,
-                                    "start_time": start_time,
-                                    "end_time": end_time,
-                                    "booking_url": booking_url,
-                                    "additional_message": "Please log in to ClubSpark first before using this link."
-                                }
-                                
-                                notification_sent = send_pushover_notification(slot_info)
-                                if notification_sent:
-                                    logger.info("Notification sent with fallback URL. Stopping search.")
-                                    return
-                            except Exception as inner_e:
-                                logger.error(f"Error with fallback notification: {str(inner_e)}")
-                        
-                        # Go back to the availability page to check other slots if we didn't return earlier
-                        page.goto(url, wait_until="networkidle")
-                        
-                        # Wait for the booking calendar to reload
-                        try:
-                            page.wait_for_selector(".booking-sheet", timeout=30000)
-                            logger.info("Booking calendar reloaded successfully")
-                        except Exception as e:
-                            logger.warning(f"Booking calendar not reloaded after returning to availability page: {str(e)}")
-                            # Add a small delay to give the page more time to load
-                            page.wait_for_timeout(5000)
+                if page is None:
+                    page = await context.new_page()
+                    await load_booking_sheet(page, slot["url"])
+                with log_context(venue=slot["venue"], date=slot["date"]), timed("click_through"):
+                    slot_info = await prepare_slot_notification(page, slot)
+                clicked = True
+            if slot_info:
+                # List each other start time once (coalesced runs share their first slot)
+                seen = {(slot["venue"], slot["date"], slot["court"], slot["start_minutes"])}
+                others = []
+                for other in candidates:
+                    key = (other["venue"], other["date"], other["court"], other["start_minutes"])
+                    if key not in seen:
+                        seen.add(key)
+                        others.append(slot_notification_info(other))
+                notified = [slot] + [other for other in candidates if other is not slot]
+                
+                # Remember the slots, and diff later runs against these grids, once the
+                # digest has actually been delivered; a failed delivery is retried next run
+                def record_delivery(done):
+                    if done.exception() is None and done.result():
+                        SLOTS.inc(len(notified), stage="notified", source="browser")
+                        notified_store.mark_notified(notified)
+                        for grid in grids:
+                            grid_store.save(grid)
+                
+                notifier.notify([slot_info] + others).add_done_callback(record_delivery)
                 
-                except Exception as e:
-                    logger.error(f"Error processing slot: {str(e)}")
-                    # Continue with next slot
-                    page.goto(url, wait_until="networkidle")
+                # The user hears about the slot first; booking it follows up with the outcome
+                if AUTO_BOOK:
+                    await book_and_report(context, slot, mode)
+                
+                # Screenshot the booking form only once the notification is on its way; the
+                # sign-in navigation was aborted, so the page still shows the form
+                if clicked:
+                    start_time = minutes_to_time_str(slot["start_minutes"]).replace(':', '')
+                    await screenshots.capture(page, f"booking_page_{slot['date']}_{start_time}", mode)
+                
+                logger.info("Notification queued. Stopping search as we found a matching slot.")
+                return True
+        except Exception as e:
+            logger.error(f"Error processing slot: {str(e)}")
+        finally:
+            if page is not None:
+                await page.close()
+            if slot is held["best"]:
+                held["page"] = None
+    
+    return False
+
+def check_court_availability(dates=None, venues=None):
+    """Main function to check for available tennis courts.
+
+    dates defaults to get_target_dates() and venues to the enabled venues;
+    each date is matched with its own day type rules. Returns True if a
+    notification was sent. Errors are logged and counted, then re-raised so
+    callers (the check jobs) can report the check as failed.
+    """
+    with log_context(run_id=new_run_id()):
+        logger.info("Starting court availability check")
+        start = time.perf_counter()
+        
+        try:
+            # Forget notified slots whose date has passed
+            today = datetime.datetime.now(pytz.timezone('Europe/London'))
+            notified_store.evict_expired(format_date_for_url(today))
+            grid_store.evict_expired(format_date_for_url(today))
+            evict_history()
+            
+            if dates is None:
+                dates = get_target_dates()
+            if venues is None:
+                venues = get_venues()
+            
+            sheets = [(venue, target_date) for venue in venues for target_date in dates]
+            
+            # Match the sheets the HTTP data covers; only the rest need the browser
+            found = []
+            if AVAILABILITY_MODE == "http":
+                unread = []
+                for venue, target_date in sheets:
+                    with log_context(venue=venue["slug"], date=format_date_for_url(target_date)):
+                        sheet_candidates = candidates_over_http(venue, target_date)
+                    if sheet_candidates is None:
+                        unread.append((venue, target_date))
+                    else:
+                        found.extend(sheet_candidates)
+                sheets = unread
+                if not sheets and not needs_browser(found):
+                    return asyncio.run(notify_best(None, found))
+            
+            # Reuse the long-lived browser; each run gets a fresh context with a page per sheet
+            # Contexts start from the saved signed-in session when auto-booking needs one
+            return shared_browser.run(
+                lambda context: scan_sheets(context, sheets, found),
+                block_profile=BLOCK_PROFILE,
+                storage_state=booking_storage_state()
+            )
         
         except Exception as e:
             logger.error(f"Error checking court availability: {str(e)}")
+            record_error("check", e)
+            raise
             
         finally:
-            if 'browser' in locals():
-                browser.close()
+            PHASE_SECONDS.observe(time.perf_counter() - start, phase="check")
             logger.info("Completed court availability check")
 
 if __name__ == "__main__":
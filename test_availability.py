@@ -8,15 +8,10 @@ without waiting for the scheduled time.
 import os
 import logging
 from tennis_booking import check_court_availability
+from log_config import setup_logging
 
 # Set up logging for testing
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
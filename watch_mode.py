@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+"""
+Push-based watch mode.
+
+Keeps every target sheet open and installs a MutationObserver on it. When
+the set of open slots changes, the page sends the new slots to Python
+through an exposed function, and they go straight to the matcher; an idle
+sheet costs no polling. Every WATCH_REFRESH_SECONDS the sheet is made to
+reload its own data (by changing its hash route), so it re-renders and the
+observer pushes what changed. Only if the sheet does not re-render is its
+data fetched and matched directly, and the page is reloaded only while
+the availability endpoint is unknown.
+
+    python watch_mode.py --minutes 60
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from availability_api import availability_client, parse_sessions_json, with_date, with_venue
+from browser_manager import shared_browser
+from metrics import PHASE_SECONDS, timed
+from log_config import log_context, new_run_id
+from sniper import FETCH_SESSIONS_JS
+from tennis_booking import (
+    BLOCK_PROFILE, EXTRACT_SLOTS_JS, SCAN_CONCURRENCY, get_target_dates, get_venues,
+    get_booking_url, format_date_for_url, load_booking_sheet, extract_slots,
+    parse_slot_record, select_candidates, notify_best, booking_storage_state
+)
+
+logger = logging.getLogger(__name__)
+
+# How long a watch session runs before the caller restarts it with fresh target dates
+WATCH_MINUTES = float(os.getenv('WATCH_MINUTES', '60'))
+
+# Seconds between soft refreshes of each sheet's data
+WATCH_REFRESH_SECONDS = float(os.getenv('WATCH_REFRESH_SECONDS', '60'))
+
+# How long (ms) a soft refresh waits for the sheet to re-render before fetching its data directly
+WATCH_RERENDER_TIMEOUT_MS = 5000
+
+# Quiet time (ms) after the last mutation before the page reports, so a
+# re-render that clears and refills the sheet is reported once
+WATCH_DEBOUNCE_MS = 50
+
+# Name of the exposed Python callback in the page
+BINDING = "__reportSlotChange"
+
+# Watches the page body (a data reload may replace the sheet and its container)
+# and reports all open slots whenever the set of open slot keys changes. Settled
+# renders of the sheet are counted, so a soft refresh can tell that it re-rendered
+WATCH_SHEET_JS = """([binding, debounceMs]) => {
+    const extractSlots = """ + EXTRACT_SLOTS_JS + """;
+    const keyOf = slot => slot.test_id || (slot.resource_id || slot.court) + '|' + slot.time_text;
+    // A sheet without session cells is still loading and would read as fully taken
+    const rendered = () => document.querySelector('.booking-sheet .resource-session') !== null;
+    if (window.__slotWatch) {
+        window.__slotWatch.observer.disconnect();
+    }
+
+    const watch = {observer: null, renders: 0};
+    let known = new Set(extractSlots().map(keyOf));
+    let timer = null;
+    const flush = () => {
+        timer = null;
+        if (!rendered()) {
+            return;
+        }
+        watch.renders += 1;
+        const slots = extractSlots();
+        const keys = new Set(slots.map(keyOf));
+        const opened = [...keys].filter(key => !known.has(key)).length;
+        const closed = [...known].filter(key => !keys.has(key)).length;
+        known = keys;
+        if (opened || closed) {
+            window[binding]({slots: slots, opened: opened, closed: closed, at: Date.now()});
+        }
+    };
+
+    watch.observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(flush, debounceMs);
+    });
+    watch.observer.observe(document.body, {
+        subtree: true, childList: true, attributes: true, attributeFilter: ['class']
+    });
+    window.__slotWatch = watch;
+    return known.size;
+}"""
+
+# Makes the sheet reload its sessions through its own client-side route: the
+# throwaway parameter changes the hash each time, so the route always re-runs.
+# Returns the render count to wait past
+RELOAD_SHEET_JS = """dateStr => {
+    const renders = window.__slotWatch ? window.__slotWatch.renders : 0;
+    location.hash = '?date=' + dateStr + '&refresh=' + Date.now();
+    return renders;
+}"""
+
+# Resolves once the observer has seen a settled render after the given count
+RERENDERED_JS = "renders => window.__slotWatch && window.__slotWatch.renders > renders"
+
+class SheetWatch:
+    """One open booking sheet whose slot changes are pushed to the matcher."""
+
+    def __init__(self, context, venue, target_date, mode="watch"):
+        self.context = context
+        self.venue = venue
+        self.target_date = target_date
+        self.date_str = format_date_for_url(target_date)
+        self.url = get_booking_url(venue["slug"], self.date_str)
+        self.mode = mode
+        self.page = None
+        self.pushes = 0
+        self._lock = asyncio.Lock()
+
+    def log_context(self):
+        return log_context(venue=self.venue["slug"], date=self.date_str)
+
+    async def start(self):
+        """Open the sheet, match what is open now and start observing it."""
+        self.page = await self.context.new_page()
+        if not availability_client.is_ready():
+            self.page.on("response", availability_client.capture)
+        await self.page.expose_function(BINDING, self.on_change)
+        await self.load()
+
+    async def load(self):
+        """(Re)load the sheet, match its slots and install the observer."""
+        await load_booking_sheet(self.page, self.url)
+        await self.match(await extract_slots(self.page), "browser")
+        watched = await self.page.evaluate(WATCH_SHEET_JS, [BINDING, WATCH_DEBOUNCE_MS])
+        logger.info(f"Watching {self.venue['name']} sheet for {self.date_str} ({watched} open slots)")
+
+    async def on_change(self, payload):
+        """Called from the page when its open slots change."""
+        with self.log_context():
+            latency = time.time() - payload["at"] / 1000
+            PHASE_SECONDS.observe(max(latency, 0), phase="watch_push")
+            self.pushes += 1
+            logger.info(
+                f"Sheet changed: {payload['opened']} opened, {payload['closed']} closed, "
+                f"reached Python in {latency * 1000:.0f}ms"
+            )
+            slots = [parse_slot_record(record) for record in payload["slots"]]
+            await self.match(slots, "browser")
+
+    async def soft_refresh(self):
+        """Have the sheet reload its own data, so the observer pushes any change.
+
+        If the sheet does not re-render within WATCH_RERENDER_TIMEOUT_MS (it
+        kept an unchanged sheet as it was, or ignored the route change), the
+        data is fetched in-page and matched directly, reloading the page only
+        if the endpoint is unknown.
+        """
+        with self.log_context():
+            try:
+                renders = await self.page.evaluate(RELOAD_SHEET_JS, self.date_str)
+                try:
+                    with timed("sheet_rerender"):
+                        await self.page.wait_for_function(RERENDERED_JS, arg=renders, timeout=WATCH_RERENDER_TIMEOUT_MS)
+                    return
+                except Exception:
+                    logger.debug(f"Sheet did not re-render within {WATCH_RERENDER_TIMEOUT_MS}ms, fetching its data directly")
+                
+                if not availability_client.is_ready():
+                    await self.load()
+                    return
+                url = with_date(with_venue(availability_client.endpoint_url, self.venue["slug"]), self.date_str)
+                with timed("sheet_refetch"):
+                    data = await self.page.evaluate(FETCH_SESSIONS_JS, url)
+                await self.match(parse_sessions_json(data, self.date_str), "http")
+            except Exception as e:
+                logger.warning(f"Soft refresh of {self.venue['name']} sheet failed: {str(e)}")
+
+    async def match(self, slots, source):
+        """Run the slots through the matcher and notify new candidates; one sheet at a time."""
+        async with self._lock:
+            candidates = select_candidates(slots, self.venue, self.target_date, source=source)
+            if candidates:
+                await notify_best(self.context, candidates, mode=self.mode)
+
+    async def close(self):
+        if self.page is not None:
+            await self.page.close()
+
+async def watch(context, venues, dates, until):
+    """Watch every (venue, date) sheet until the given Unix timestamp."""
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    watches = [SheetWatch(context, venue, target_date) for venue in venues for target_date in dates]
+
+    async def start(sheet):
+        async with semaphore:
+            with sheet.log_context():
+                try:
+                    await sheet.start()
+                except Exception as e:
+                    logger.error(f"Could not start watching {sheet.venue['name']} on {sheet.date_str}: {str(e)}")
+
+    try:
+        await asyncio.gather(*(start(sheet) for sheet in watches))
+        watching = [sheet for sheet in watches if sheet.page is not None]
+        while time.time() < until:
+            await asyncio.sleep(min(WATCH_REFRESH_SECONDS, max(0, until - time.time())))
+            await asyncio.gather(*(sheet.soft_refresh() for sheet in watching))
+    finally:
+        await asyncio.gather(*(sheet.close() for sheet in watches), return_exceptions=True)
+        logger.info(f"Watch finished, {sum(sheet.pushes for sheet in watches)} pushed changes")
+
+def run_watch(minutes=WATCH_MINUTES):
+    """Watch the target dates at every enabled venue for the given number of minutes."""
+    logger.info(f"Starting watch mode for {minutes:g} minutes")
+    try:
+        with log_context(run_id=new_run_id()):
+            shared_browser.run(
+                lambda context: watch(context, get_venues(), get_target_dates(), time.time() + minutes * 60),
+                block_profile=BLOCK_PROFILE,
+                storage_state=booking_storage_state()
+            )
+    except Exception as e:
+        logger.error(f"Error in watch mode: {str(e)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the booking sheets for slot changes")
+    parser.add_argument("--minutes", type=float, default=WATCH_MINUTES, help=f"how long to watch (default: {WATCH_MINUTES:g})")
+    args = parser.parse_args()
+    run_watch(args.minutes)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())